@@ -0,0 +1,86 @@
+"""
+Dense embedding runtime benchmark.
+Chunks a source tree the same way ingestion does, embeds it with the fp32 torch model
+and the int8 ONNX model, and reports throughput plus how well the quantized vectors
+preserve retrieval against the fp32 baseline:
+
+    python benchmark_embeddings.py                     # chunks this backend's own code
+    python benchmark_embeddings.py --corpus ../some/repo --threads 4
+
+recall@k: for sampled chunks used as queries, the fraction of the fp32 top-k neighbours
+that the ONNX vectors also rank in their top-k.
+"""
+
+import argparse
+import os
+import random
+import time
+import numpy as np
+from core.embeddings import load_local_embeddings, OnnxEmbeddings, onnx_available, EMBEDDING_ONNX_FILE
+from services.ingestion import iter_indexable_paths, load_documents, split_documents
+
+
+def load_corpus(path: str, max_chunks: int) -> list[str]:
+    documents, _ = load_documents(path, list(iter_indexable_paths(path)))
+    chunks = [chunk.page_content for chunk in split_documents(documents)]
+    random.Random(0).shuffle(chunks)
+    return chunks[:max_chunks]
+
+
+def measure(embeddings, texts: list[str], batch_size: int) -> tuple[np.ndarray, float]:
+    """Vectors for texts and throughput in chunks/sec (after one warm-up batch)"""
+    embeddings.embed_documents(texts[:batch_size])
+    started = time.perf_counter()
+    vectors = []
+    for i in range(0, len(texts), batch_size):
+        vectors.extend(embeddings.embed_documents(texts[i:i + batch_size]))
+    elapsed = time.perf_counter() - started
+    return np.asarray(vectors, dtype=np.float32), len(texts) / elapsed
+
+
+def recall_at_k(baseline: np.ndarray, candidate: np.ndarray, queries: int, k: int) -> float:
+    query_ids = random.Random(1).sample(range(len(baseline)), min(queries, len(baseline)))
+    hits = 0
+    for query_id in query_ids:
+        # exclude the query chunk itself from its neighbours
+        expected_scores = baseline @ baseline[query_id]
+        actual_scores = candidate @ candidate[query_id]
+        expected_scores[query_id] = actual_scores[query_id] = -np.inf
+        expected = set(np.argsort(-expected_scores)[:k])
+        actual = set(np.argsort(-actual_scores)[:k])
+        hits += len(expected & actual)
+    return hits / (len(query_ids) * k)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare fp32 torch and int8 ONNX embedding runtimes")
+    parser.add_argument("--corpus", default=os.path.dirname(os.path.abspath(__file__)), help="directory to chunk and embed")
+    parser.add_argument("--max-chunks", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=128, help="same as INGEST_CHUNK_BATCH_SIZE by default")
+    parser.add_argument("--threads", type=int, default=0, help="onnxruntime intra-op threads (0 = runtime default)")
+    parser.add_argument("--onnx-file", default=EMBEDDING_ONNX_FILE)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+
+    if not onnx_available():
+        raise SystemExit("optimum[onnxruntime] is not installed: pip install optimum[onnxruntime]")
+
+    texts = load_corpus(args.corpus, args.max_chunks)
+    if len(texts) <= args.k:
+        raise SystemExit(f"Corpus {args.corpus} only has {len(texts)} chunks, need more than k={args.k}")
+    print(f"Corpus: {len(texts)} chunks from {args.corpus}")
+
+    baseline, baseline_rate = measure(load_local_embeddings("torch"), texts, args.batch_size)
+    print(f"torch fp32:  {baseline_rate:8.1f} chunks/sec")
+
+    candidate, candidate_rate = measure(OnnxEmbeddings(args.onnx_file, args.threads), texts, args.batch_size)
+    print(f"onnx int8:   {candidate_rate:8.1f} chunks/sec ({candidate_rate / baseline_rate:.2f}x, {args.onnx_file}, threads={args.threads or 'default'})")
+
+    agreement = float(np.mean(np.sum(baseline * candidate, axis=1)))
+    print(f"mean cosine(fp32, int8): {agreement:.4f}")
+    print(f"recall@{args.k} vs fp32:     {recall_at_k(baseline, candidate, args.queries, args.k):.4f}")
+
+
+if __name__ == "__main__":
+    main()
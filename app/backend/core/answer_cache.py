@@ -0,0 +1,116 @@
+"""
+Semantic answer cache.
+Chat answers are cached per repository version (collection alias + serving collection +
+indexed commit) and reused for later questions whose query embedding is close enough,
+so repeated questions skip retrieval and the LLM call. Entries for an older version are
+dropped as soon as a chat sees the repository was re-indexed.
+"""
+
+import os
+import time
+import itertools
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+
+class AnswerCache:
+    """In-process answer cache with cosine-similarity lookup, TTL and least-recently-used eviction."""
+
+    def __init__(self):
+        self.enabled = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+        self.similarity_threshold = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+        self.ttl_seconds = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+        self.max_entries = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+
+        # entry id -> entry, least recently used first
+        self.entries = OrderedDict()
+        # collection alias -> (version, entry ids)
+        self.scopes: Dict[str, Tuple[str, set]] = {}
+        self.ids = itertools.count()
+
+    @staticmethod
+    def get_version(repo: Dict) -> str:
+        """Changes whenever the repository is re-indexed (new collection version or new commit)"""
+        return f"{repo.get('active_collection') or repo['collection_name']}@{repo.get('last_commit_sha') or ''}"
+
+    @staticmethod
+    def _normalize(vector: List[float]) -> np.ndarray:
+        array = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(array)
+        return array / norm if norm else array
+
+    def _remove(self, entry_id: int) -> None:
+        entry = self.entries.pop(entry_id, None)
+        if entry:
+            scope = self.scopes.get(entry["alias"])
+            if scope:
+                scope[1].discard(entry_id)
+
+    def invalidate(self, alias: str) -> None:
+        """Drop every cached answer for a repository (on delete)"""
+        _, entry_ids = self.scopes.pop(alias, (None, set()))
+        for entry_id in entry_ids:
+            self.entries.pop(entry_id, None)
+
+    def _scope_ids(self, repo: Dict) -> set:
+        alias = repo["collection_name"]
+        version = self.get_version(repo)
+        scope = self.scopes.get(alias)
+        if scope and scope[0] != version:
+            # repository was re-indexed since these answers were cached
+            self.invalidate(alias)
+            scope = None
+        if scope is None:
+            scope = (version, set())
+            self.scopes[alias] = scope
+        return scope[1]
+
+    def lookup(self, repo: Dict, query_vector: List[float]) -> Optional[Dict]:
+        """Best cached answer above the similarity threshold, or None"""
+        if not self.enabled:
+            return None
+
+        entry_ids = self._scope_ids(repo)
+        now = time.monotonic()
+        for entry_id in [i for i in entry_ids if now - self.entries[i]["created_at"] > self.ttl_seconds]:
+            self._remove(entry_id)
+        if not entry_ids:
+            return None
+
+        candidates = list(entry_ids)
+        vectors = np.stack([self.entries[i]["vector"] for i in candidates])
+        scores = vectors @ self._normalize(query_vector)
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity_threshold:
+            return None
+
+        entry_id = candidates[best]
+        self.entries.move_to_end(entry_id)
+        entry = self.entries[entry_id]
+        return {"response": entry["response"], "sources": entry["sources"], "similarity": float(scores[best])}
+
+    def store(self, repo: Dict, query_vector: List[float], response: str, sources: List[Dict]) -> None:
+        if not self.enabled or not response:
+            return
+
+        scope = self.scopes.get(repo["collection_name"])
+        if scope and scope[0] != self.get_version(repo):
+            # answered from a version that was replaced while the LLM was running
+            return
+
+        entry_id = next(self.ids)
+        self._scope_ids(repo).add(entry_id)
+        self.entries[entry_id] = {
+            "alias": repo["collection_name"],
+            "vector": self._normalize(query_vector),
+            "response": response,
+            "sources": sources,
+            "created_at": time.monotonic()
+        }
+        while len(self.entries) > self.max_entries:
+            self._remove(next(iter(self.entries)))
+
+
+# global instance
+answer_cache = AnswerCache()
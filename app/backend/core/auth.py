@@ -1,6 +1,10 @@
 import os
+import time
+import asyncio
+import hashlib
+import httpx
 import jwt
-from jwt import PyJWKClient
+from collections import OrderedDict
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
@@ -10,6 +14,10 @@ load_dotenv()
 
 CLERK_SECRET_KEY = os.getenv("CLERK_SECRET_KEY")
 CLERK_JWKS_URL = os.getenv("CLERK_JWKS_URL")
+JWKS_REFRESH_INTERVAL_SECONDS = int(os.getenv("JWKS_REFRESH_INTERVAL_SECONDS", "3600"))
+# an unknown kid triggers an on-demand refresh at most this often
+JWKS_MIN_REFRESH_INTERVAL_SECONDS = int(os.getenv("JWKS_MIN_REFRESH_INTERVAL_SECONDS", "30"))
+TOKEN_CACHE_MAX_ENTRIES = int(os.getenv("TOKEN_CACHE_MAX_ENTRIES", "10000"))
 
 if not CLERK_SECRET_KEY:
     raise Exception("CLERK_SECRET_KEY not found in environment variables")
@@ -18,19 +26,84 @@ if not CLERK_JWKS_URL:
     raise Exception("CLERK_JWKS_URL not found in environment variables. Add it to .env file.")
 
 security = HTTPBearer()
-jwks_client: Optional[PyJWKClient] = None
 
-def get_jwks_client() -> PyJWKClient:
-    global jwks_client
-    if jwks_client is None:
+# kid -> public key, replaced wholesale on every JWKS refresh
+signing_keys: Dict[str, object] = {}
+jwks_last_refresh = 0.0
+jwks_refresh_lock: Optional[asyncio.Lock] = None
+jwks_refresh_task: Optional[asyncio.Task] = None
+
+# sha256(token) -> (exp, user context), least recently used first
+verified_tokens = OrderedDict()
+
+async def refresh_jwks() -> None:
+    """Fetch Clerk's JWKS and swap in the new key set"""
+    global signing_keys, jwks_last_refresh
+    async with httpx.AsyncClient(timeout=10.0) as client:
+        response = await client.get(CLERK_JWKS_URL)
+        response.raise_for_status()
+    jwk_set = jwt.PyJWKSet.from_dict(response.json())
+    signing_keys = {key.key_id: key.key for key in jwk_set.keys}
+    jwks_last_refresh = time.monotonic()
+    print(f"[Auth] Loaded {len(signing_keys)} JWKS signing keys")
+
+async def jwks_refresh_loop() -> None:
+    while True:
+        await asyncio.sleep(JWKS_REFRESH_INTERVAL_SECONDS)
         try:
-            jwks_client = PyJWKClient(CLERK_JWKS_URL)
+            await refresh_jwks()
         except Exception as e:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Failed to initialize JWT verification: {str(e)}"
-            )
-    return jwks_client
+            # keep serving with the previous keys
+            print(f"[Auth] JWKS refresh failed: {e}")
+
+async def start_jwks_refresh() -> None:
+    """Prefetch JWKS and keep it fresh in the background (FastAPI startup)"""
+    global jwks_refresh_task
+    try:
+        await refresh_jwks()
+    except Exception as e:
+        print(f"[Auth] Initial JWKS fetch failed, will retry on first request: {e}")
+    jwks_refresh_task = asyncio.create_task(jwks_refresh_loop())
+
+async def stop_jwks_refresh() -> None:
+    if jwks_refresh_task:
+        jwks_refresh_task.cancel()
+
+async def get_signing_key(token: str):
+    kid = jwt.get_unverified_header(token).get("kid")
+    key = signing_keys.get(kid)
+    if key is not None:
+        return key
+
+    # key rotation (or startup fetch failed): refresh once, concurrent requests wait on the same fetch
+    global jwks_refresh_lock
+    if jwks_refresh_lock is None:
+        jwks_refresh_lock = asyncio.Lock()
+    async with jwks_refresh_lock:
+        if kid not in signing_keys and time.monotonic() - jwks_last_refresh >= JWKS_MIN_REFRESH_INTERVAL_SECONDS:
+            await refresh_jwks()
+    key = signing_keys.get(kid)
+    if key is None:
+        raise jwt.InvalidTokenError("Unable to find a signing key that matches the token")
+    return key
+
+def get_cached_user(token_hash: str) -> Optional[Dict]:
+    entry = verified_tokens.get(token_hash)
+    if entry is None:
+        return None
+    exp, user = entry
+    if exp <= time.time():
+        del verified_tokens[token_hash]
+        return None
+    verified_tokens.move_to_end(token_hash)
+    return dict(user)
+
+def cache_verified_user(token_hash: str, exp: Optional[int], user: Dict) -> None:
+    if not exp:
+        return
+    verified_tokens[token_hash] = (exp, dict(user))
+    while len(verified_tokens) > TOKEN_CACHE_MAX_ENTRIES:
+        verified_tokens.popitem(last=False)
 
 def get_org_context(decoded_jwt: dict) -> dict:
     """
@@ -47,14 +120,19 @@ def get_org_context(decoded_jwt: dict) -> dict:
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> Dict[str, str]:
     token = credentials.credentials
+
+    # the same bearer token was already verified and has not expired: skip RS256
+    token_hash = hashlib.sha256(token.encode()).hexdigest()
+    cached_user = get_cached_user(token_hash)
+    if cached_user:
+        return cached_user
     
     try:
-        jwks_client = get_jwks_client()
-        signing_key = jwks_client.get_signing_key_from_jwt(token)
+        signing_key = await get_signing_key(token)
         
         decoded = jwt.decode(
             token,
-            signing_key.key,
+            signing_key,
             algorithms=["RS256"],
             options={"verify_signature": True, "verify_exp": True}
         )
@@ -72,12 +150,14 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         # extract org context from JWT
         org_context = get_org_context(decoded)
         
-        return {
+        user = {
             "user_id": user_id,
             "email": email or None,
             "org_id": org_context.get("org_id"),
             "org_role": org_context.get("org_role")
         }
+        cache_verified_user(token_hash, decoded.get("exp"), user)
+        return user
     
     except jwt.ExpiredSignatureError:
         raise HTTPException(
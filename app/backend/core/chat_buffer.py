@@ -0,0 +1,195 @@
+"""
+Write-behind buffer for chat history.
+Answered chats are appended to an in-process buffer and written with one insert_many per
+batch, either once CHAT_WRITE_BATCH_SIZE documents are waiting or every
+CHAT_WRITE_FLUSH_INTERVAL_SECONDS, so the Mongo write is no longer on the chat response
+path. The buffer is flushed on shutdown.
+
+A batch that fails with a transient error (connection loss, server selection or write
+timeouts) goes back to the front of the buffer and is retried on the next flush, up to
+CHAT_WRITE_MAX_ATTEMPTS times per document. Documents the server rejects outright are
+dropped; every drop is counted and logged.
+
+Durability (CHAT_WRITE_DURABILITY):
+    buffered     - return as soon as the chat is buffered; a crash loses at most one
+                   flush interval of history (default)
+    acknowledged - still batched, but the caller waits until its chat is written (or dropped)
+"""
+
+import os
+import time
+import asyncio
+from typing import Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from pymongo.errors import BulkWriteError, ConnectionFailure, ExecutionTimeout, WTimeoutError
+from core.database import get_database
+
+load_dotenv()
+
+CHAT_WRITE_BATCH_SIZE = int(os.getenv("CHAT_WRITE_BATCH_SIZE", "50"))
+CHAT_WRITE_FLUSH_INTERVAL_SECONDS = float(os.getenv("CHAT_WRITE_FLUSH_INTERVAL_SECONDS", "1"))
+# past this many pending documents callers wait for a flush instead of growing the buffer
+CHAT_WRITE_MAX_BUFFER = int(os.getenv("CHAT_WRITE_MAX_BUFFER", "5000"))
+CHAT_WRITE_MAX_ATTEMPTS = int(os.getenv("CHAT_WRITE_MAX_ATTEMPTS", "5"))
+CHAT_WRITE_DURABILITY = os.getenv("CHAT_WRITE_DURABILITY", "buffered")
+
+# errors worth retrying the whole batch for; anything else is a rejection of the documents
+TRANSIENT_WRITE_ERRORS = (ConnectionFailure, ExecutionTimeout, WTimeoutError)
+DUPLICATE_KEY_ERROR = 11000
+
+# (chat document, failed attempts so far, future of an acknowledged-mode caller)
+PendingChat = Tuple[Dict, int, Optional[asyncio.Future]]
+
+
+class ChatWriteBuffer:
+    """Batches chat documents into insert_many calls from a background flush task."""
+
+    def __init__(self):
+        self.acknowledged = CHAT_WRITE_DURABILITY == "acknowledged"
+        self.pending: List[PendingChat] = []
+        self.flush_task: Optional[asyncio.Task] = None
+        self.stopping = False
+        # created lazily so they bind to the running event loop
+        self.wakeup: Optional[asyncio.Event] = None
+        self.flush_lock: Optional[asyncio.Lock] = None
+        self.stats = {
+            "buffered": 0, "written": 0, "retried": 0, "failed": 0, "flushes": 0,
+            "last_batch_size": 0, "total_flush_seconds": 0.0, "max_flush_seconds": 0.0
+        }
+
+    async def start(self) -> None:
+        self.stopping = False
+        self.wakeup = asyncio.Event()
+        self.flush_lock = asyncio.Lock()
+        self.flush_task = asyncio.create_task(self.flush_loop())
+        print(f"[ChatBuffer] Write-behind enabled (batch={CHAT_WRITE_BATCH_SIZE}, "
+              f"interval={CHAT_WRITE_FLUSH_INTERVAL_SECONDS}s, durability={CHAT_WRITE_DURABILITY})")
+
+    async def stop(self) -> None:
+        """Stop the flush task and write whatever is still buffered"""
+        if self.flush_task:
+            # let the loop finish its current flush and exit; cancelling it mid-insert
+            # would drop the batch it already took out of pending
+            self.stopping = True
+            self.wakeup.set()
+            await self.flush_task
+            self.flush_task = None
+        await self.flush()
+        if self.pending:
+            # nothing retries after shutdown
+            self.drop(self.pending, "still failing at shutdown")
+            self.pending = []
+
+    async def add(self, chat_doc: Dict) -> None:
+        if self.flush_task is None:
+            # not started (scripts, tests): write inline
+            await get_database().chats.insert_one(chat_doc)
+            return
+
+        if len(self.pending) >= CHAT_WRITE_MAX_BUFFER:
+            await self.flush()
+
+        waiter = asyncio.get_running_loop().create_future() if self.acknowledged else None
+        self.pending.append((chat_doc, 0, waiter))
+        self.stats["buffered"] += 1
+        if len(self.pending) >= CHAT_WRITE_BATCH_SIZE:
+            self.wakeup.set()
+
+        if waiter:
+            await waiter
+
+    async def flush_loop(self) -> None:
+        while not self.stopping:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=CHAT_WRITE_FLUSH_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"[ChatBuffer] Flush failed: {e}")
+
+    def resolve(self, entries: List[PendingChat], error: Optional[Exception] = None) -> None:
+        for _, _, waiter in entries:
+            if waiter is None or waiter.done():
+                continue
+            if error:
+                waiter.set_exception(error)
+            else:
+                waiter.set_result(None)
+
+    def drop(self, entries: List[PendingChat], reason: str, error: Optional[Exception] = None) -> None:
+        if not entries:
+            return
+        self.stats["failed"] += len(entries)
+        print(f"[ChatBuffer] Dropped {len(entries)} chats ({reason})")
+        self.resolve(entries, error or RuntimeError(f"Chat was not saved: {reason}"))
+
+    def requeue(self, entries: List[PendingChat], error: Exception) -> None:
+        """Put a transiently failed batch back in front of newer chats for the next flush"""
+        retry = [(doc, attempts + 1, waiter) for doc, attempts, waiter in entries]
+        exhausted = [entry for entry in retry if entry[1] >= CHAT_WRITE_MAX_ATTEMPTS]
+        retry = [entry for entry in retry if entry[1] < CHAT_WRITE_MAX_ATTEMPTS]
+        self.drop(exhausted, f"{CHAT_WRITE_MAX_ATTEMPTS} failed attempts, last error: {error}", error)
+
+        # newer chats keep their place; the oldest retries give way if the buffer is full
+        room = max(CHAT_WRITE_MAX_BUFFER - len(self.pending), 0)
+        overflow = retry[:max(len(retry) - room, 0)]
+        self.drop(overflow, "buffer full while retrying", error)
+        retry = retry[len(overflow):]
+
+        self.pending = retry + self.pending
+        self.stats["retried"] += len(retry)
+        if retry:
+            print(f"[ChatBuffer] Failed to write {len(entries)} chats, retrying {len(retry)}: {error}")
+
+    async def flush(self) -> None:
+        if self.flush_lock is None:
+            return
+        async with self.flush_lock:
+            if not self.pending:
+                return
+            batch, self.pending = self.pending, []
+
+            started = time.perf_counter()
+            try:
+                # unordered: one bad document does not block the rest of the batch
+                await get_database().chats.insert_many([doc for doc, _, _ in batch], ordered=False)
+                self.stats["written"] += len(batch)
+                self.resolve(batch)
+            except BulkWriteError as e:
+                # the rest of the batch was written; a duplicate _id means an earlier
+                # attempt already wrote that chat, any other write error is a rejection
+                rejected = {
+                    error["index"] for error in e.details.get("writeErrors", [])
+                    if error.get("code") != DUPLICATE_KEY_ERROR
+                }
+                failed = [entry for i, entry in enumerate(batch) if i in rejected]
+                saved = [entry for i, entry in enumerate(batch) if i not in rejected]
+                self.stats["written"] += len(saved)
+                self.resolve(saved)
+                self.drop(failed, "rejected by MongoDB", e)
+            except TRANSIENT_WRITE_ERRORS as e:
+                self.requeue(batch, e)
+            except Exception as e:
+                self.drop(batch, f"write error: {e}", e)
+            finally:
+                elapsed = time.perf_counter() - started
+                self.stats["flushes"] += 1
+                self.stats["last_batch_size"] = len(batch)
+                self.stats["total_flush_seconds"] += elapsed
+                self.stats["max_flush_seconds"] = max(self.stats["max_flush_seconds"], elapsed)
+
+    def get_metrics(self) -> Dict:
+        flushes = self.stats["flushes"]
+        return {
+            **self.stats,
+            "depth": len(self.pending),
+            "avg_flush_seconds": self.stats["total_flush_seconds"] / flushes if flushes else 0.0,
+            "durability": CHAT_WRITE_DURABILITY
+        }
+
+
+# global instance
+chat_write_buffer = ChatWriteBuffer()
@@ -0,0 +1,150 @@
+"""
+Content-addressed embedding cache.
+Vectors are keyed by model name + sha256 of the chunk text and stored in MongoDB,
+so identical chunks (re-ingests, forks, branches, vendored copies) are embedded once
+per model across all tenants and workers.
+"""
+
+import os
+import asyncio
+import hashlib
+from array import array
+from datetime import datetime
+from typing import Dict, List, Optional
+from bson import Binary
+from pymongo import UpdateOne
+from qdrant_client.models import SparseVector
+from core.database import get_database
+
+
+class EmbeddingCache:
+    """Dense and BM25 sparse vector cache with least-recently-used eviction by entry count."""
+
+    def __init__(self):
+        self.enabled = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+        self.max_entries = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "1000000"))
+
+    @staticmethod
+    def make_key(model_name: str, text: str) -> str:
+        return f"{model_name}:{hashlib.sha256(text.encode('utf-8', errors='ignore')).hexdigest()}"
+
+    @staticmethod
+    def _encode_dense(vector: List[float]) -> Binary:
+        # float32 bytes are ~4x smaller than a BSON array of doubles
+        return Binary(array("f", vector).tobytes())
+
+    @staticmethod
+    def _decode_dense(data: bytes) -> List[float]:
+        vector = array("f")
+        vector.frombytes(data)
+        return vector.tolist()
+
+    @staticmethod
+    def _encode_sparse(vector) -> Dict:
+        return {
+            "indices": Binary(array("I", vector.indices).tobytes()),
+            "values": Binary(array("f", vector.values).tobytes())
+        }
+
+    @staticmethod
+    def _decode_sparse(data: Dict) -> SparseVector:
+        indices, values = array("I"), array("f")
+        indices.frombytes(data["indices"])
+        values.frombytes(data["values"])
+        return SparseVector(indices=indices.tolist(), values=values.tolist())
+
+    async def get_many(self, keys: List[str]) -> Dict[str, Dict]:
+        """Fetch cached entries and mark them as recently used"""
+        db = get_database()
+        found = {}
+        async for entry in db.embedding_cache.find({"_id": {"$in": keys}}):
+            found[entry["_id"]] = entry
+
+        if found:
+            await db.embedding_cache.update_many(
+                {"_id": {"$in": list(found)}},
+                {"$set": {"last_used_at": datetime.utcnow()}}
+            )
+        return found
+
+    async def put_many(self, model_name: str, entries: Dict[str, Dict]) -> None:
+        """Upsert {key: {"dense": ...} | {"sparse": ...}}; concurrent writers of the same key are harmless"""
+        if not entries:
+            return
+        db = get_database()
+        now = datetime.utcnow()
+        await db.embedding_cache.bulk_write(
+            [
+                UpdateOne(
+                    {"_id": key},
+                    {"$setOnInsert": {"model": model_name, "created_at": now, **value}, "$set": {"last_used_at": now}},
+                    upsert=True
+                )
+                for key, value in entries.items()
+            ],
+            ordered=False
+        )
+
+    async def _embed(self, model_name: str, texts: List[str], embed_fn, encode, decode, field: str, stats: Dict) -> List:
+        keys = [self.make_key(model_name, text) for text in texts]
+        # identical texts within the batch are embedded once
+        unique = dict(zip(keys, texts))
+
+        cached = {}
+        if self.enabled:
+            try:
+                cached = {key: decode(entry[field]) for key, entry in (await self.get_many(list(unique))).items() if field in entry}
+            except Exception as e:
+                print(f"[EmbeddingCache] Lookup failed, embedding without cache: {e}")
+
+        missing = [key for key in unique if key not in cached]
+        stats[f"{field}_hits"] = stats.get(f"{field}_hits", 0) + len(texts) - len(missing)
+        stats[f"{field}_misses"] = stats.get(f"{field}_misses", 0) + len(missing)
+
+        if missing:
+            vectors = await asyncio.to_thread(embed_fn, [unique[key] for key in missing])
+            computed = dict(zip(missing, vectors))
+            cached.update(computed)
+
+            if self.enabled:
+                try:
+                    await self.put_many(model_name, {key: {field: encode(vector)} for key, vector in computed.items()})
+                except Exception as e:
+                    print(f"[EmbeddingCache] Failed to store vectors: {e}")
+
+        return [cached[key] for key in keys]
+
+    async def embed_dense(self, embeddings, texts: List[str], stats: Dict) -> List[List[float]]:
+        """Dense vectors for texts, calling the model only for cache misses"""
+        return await self._embed(
+            embeddings.model_name, texts, embeddings.embed_documents,
+            self._encode_dense, self._decode_dense, "dense", stats
+        )
+
+    async def embed_sparse(self, sparse_embeddings, texts: List[str], stats: Dict) -> List:
+        """BM25 sparse vectors for texts, calling the model only for cache misses"""
+        return await self._embed(
+            sparse_embeddings.model_name, texts, sparse_embeddings.embed_documents,
+            self._encode_sparse, self._decode_sparse, "sparse", stats
+        )
+
+    async def enforce_limit(self) -> Optional[int]:
+        """Evict least recently used entries beyond max_entries. Returns number evicted."""
+        if not self.enabled:
+            return None
+        db = get_database()
+        excess = await db.embedding_cache.estimated_document_count() - self.max_entries
+        if excess <= 0:
+            return 0
+
+        stale_keys = [
+            entry["_id"]
+            async for entry in db.embedding_cache.find({}, {"_id": 1}).sort("last_used_at", 1).limit(excess)
+        ]
+        result = await db.embedding_cache.delete_many({"_id": {"$in": stale_keys}})
+        print(f"[EmbeddingCache] Evicted {result.deleted_count} least recently used entries")
+        return result.deleted_count
+
+
+# global instance
+embedding_cache = EmbeddingCache()
@@ -1,10 +1,293 @@
+"""
+Dense embedding service.
+
+Runtimes (EMBEDDING_RUNTIME), for processes that load the model:
+    torch - sentence-transformers on PyTorch, fp32 (default)
+    onnx  - int8-quantized ONNX export of the same model on onnxruntime, with
+            EMBEDDING_ONNX_THREADS intra-op threads; needs `pip install optimum[onnxruntime]`.
+            Vectors differ slightly from fp32, so they are cached under their own model id.
+            Compare both with benchmark_embeddings.py
+
+Backends (EMBEDDING_BACKEND):
+    local  - load all-MiniLM-L6-v2 in this process, once per process (default)
+    server - send texts to the shared embedding sidecar (embedding_server.py) over the
+             Unix socket EMBEDDING_SERVER_SOCKET, so every API/worker process on the host
+             uses one model copy and concurrent requests are embedded in shared batches
+
+Wire format (both directions): 4-byte big-endian length + payload. A request is one
+JSON frame {"texts": [...]}; a response is a JSON frame {"count", "dim"} or {"error"},
+followed on success by one frame of count * dim little-endian float32 values.
+"""
+
+import os
+import json
+import asyncio
+import importlib.util
+import socket
+import struct
+import time
+import threading
+from typing import Dict, List, Optional
+import numpy as np
+from langchain_core.embeddings import Embeddings
 from langchain_huggingface import HuggingFaceEmbeddings
+from dotenv import load_dotenv
+
+load_dotenv()
+
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDING_RUNTIME = os.getenv("EMBEDDING_RUNTIME", "torch")
+# quantized exports shipped in the model repo; pick the one matching the CPU (avx2, avx512, avx512_vnni, arm64)
+EMBEDDING_ONNX_FILE = os.getenv("EMBEDDING_ONNX_FILE", "onnx/model_quint8_avx2.onnx")
+EMBEDDING_ONNX_THREADS = int(os.getenv("EMBEDDING_ONNX_THREADS", "0"))
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "local")
+EMBEDDING_SERVER_SOCKET = os.getenv("EMBEDDING_SERVER_SOCKET", "/tmp/infralens-embeddings.sock")
+EMBEDDING_SERVER_TIMEOUT_SECONDS = float(os.getenv("EMBEDDING_SERVER_TIMEOUT_SECONDS", "120"))
+# chat query batching: how long the first query of a batch waits for others, and the batch cap
+QUERY_EMBED_BATCH_WINDOW_MS = float(os.getenv("QUERY_EMBED_BATCH_WINDOW_MS", "5"))
+QUERY_EMBED_MAX_BATCH = int(os.getenv("QUERY_EMBED_MAX_BATCH", "32"))
+
+embeddings_instance: Optional[Embeddings] = None
+embeddings_lock = threading.Lock()
 
 
-def create_embeddings() -> HuggingFaceEmbeddings:
-    """standardized embeddings instance used across the application"""
+def onnx_available() -> bool:
+    return importlib.util.find_spec("optimum") is not None and importlib.util.find_spec("onnxruntime") is not None
+
+
+def get_model_id(runtime: str = EMBEDDING_RUNTIME) -> str:
+    """Model name plus runtime variant; embedding cache entries are keyed by it"""
+    if runtime == "onnx":
+        return f"{EMBEDDING_MODEL_NAME}@{EMBEDDING_ONNX_FILE}"
+    return EMBEDDING_MODEL_NAME
+
+
+def load_local_embeddings(runtime: str = EMBEDDING_RUNTIME) -> Embeddings:
+    """Load the model into this process"""
+    if runtime == "onnx":
+        if onnx_available():
+            return OnnxEmbeddings()
+        print("[Embeddings] EMBEDDING_RUNTIME=onnx but optimum[onnxruntime] is not installed, using torch")
     return HuggingFaceEmbeddings(
-        model_name="sentence-transformers/all-MiniLM-L6-v2",
+        model_name=EMBEDDING_MODEL_NAME,
         model_kwargs={'device': 'cpu'},
         encode_kwargs={'normalize_embeddings': True}
     )
+
+
+def create_embeddings() -> Embeddings:
+    """standardized embeddings instance used across the application, shared by the whole process"""
+    global embeddings_instance
+    if embeddings_instance is None:
+        with embeddings_lock:
+            if embeddings_instance is None:
+                if EMBEDDING_BACKEND == "server":
+                    embeddings_instance = EmbeddingServerClient(EMBEDDING_SERVER_SOCKET)
+                    print(f"[Embeddings] Using embedding server at {EMBEDDING_SERVER_SOCKET}")
+                else:
+                    embeddings_instance = load_local_embeddings()
+    return embeddings_instance
+
+
+def send_frame(sock: socket.socket, payload: bytes) -> None:
+    sock.sendall(struct.pack(">I", len(payload)) + payload)
+
+
+def recv_exactly(sock: socket.socket, size: int) -> bytes:
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("Embedding server closed the connection")
+        data.extend(chunk)
+    return bytes(data)
+
+
+def recv_frame(sock: socket.socket) -> bytes:
+    (size,) = struct.unpack(">I", recv_exactly(sock, 4))
+    return recv_exactly(sock, size)
+
+
+class OnnxEmbeddings(Embeddings):
+    """all-MiniLM-L6-v2 as an int8-quantized ONNX model on onnxruntime's CPU provider."""
+
+    def __init__(self, file_name: str = EMBEDDING_ONNX_FILE, threads: int = EMBEDDING_ONNX_THREADS):
+        import onnxruntime
+        from sentence_transformers import SentenceTransformer
+
+        session_options = onnxruntime.SessionOptions()
+        if threads > 0:
+            session_options.intra_op_num_threads = threads
+        self.model = SentenceTransformer(
+            EMBEDDING_MODEL_NAME,
+            device="cpu",
+            backend="onnx",
+            model_kwargs={"file_name": file_name, "provider": "CPUExecutionProvider", "session_options": session_options}
+        )
+        self.model_name = get_model_id("onnx")
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.model.encode(list(texts), normalize_embeddings=True).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+class EmbeddingServerClient(Embeddings):
+    """LangChain embeddings backed by the embedding server; one socket per calling thread."""
+
+    def __init__(self, socket_path: str):
+        self.socket_path = socket_path
+        # read by the embedding cache to key vectors per model; the server runs with the same settings
+        self.model_name = get_model_id()
+        self.local = threading.local()
+
+    def _connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(EMBEDDING_SERVER_TIMEOUT_SECONDS)
+        sock.connect(self.socket_path)
+        return sock
+
+    def _request(self, texts: List[str]) -> List[List[float]]:
+        sock = getattr(self.local, "sock", None)
+        if sock is None:
+            sock = self.local.sock = self._connect()
+        send_frame(sock, json.dumps({"texts": texts}).encode())
+        header = json.loads(recv_frame(sock))
+        if header.get("error"):
+            raise RuntimeError(f"Embedding server error: {header['error']}")
+        vectors = np.frombuffer(recv_frame(sock), dtype="<f4").reshape(header["count"], header["dim"])
+        return vectors.tolist()
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        try:
+            return self._request(texts)
+        except (OSError, ConnectionError):
+            # server restarted since this thread connected: reconnect once
+            self._close_thread_socket()
+            try:
+                return self._request(texts)
+            except (OSError, ConnectionError) as e:
+                self._close_thread_socket()
+                raise RuntimeError(f"Embedding server unavailable at {self.socket_path}: {e}") from e
+
+    def _close_thread_socket(self) -> None:
+        sock = getattr(self.local, "sock", None)
+        self.local.sock = None
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(list(texts))
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed([text])[0]
+
+
+class QueryBatchingEmbeddings(Embeddings):
+    """
+    Wraps an embeddings instance so concurrent aembed_query calls on the event loop share
+    one embed_documents call, the way embedding_server.BatchingEmbedder batches requests.
+    Callers await a future; the first query of a batch waits up to QUERY_EMBED_BATCH_WINDOW_MS
+    for others (or until QUERY_EMBED_MAX_BATCH are queued), and only the batched model call
+    runs in a thread, so waiting queries hold no thread.
+    Sync embed_query/embed_documents pass straight through.
+    """
+
+    def __init__(self, embeddings: Embeddings, window_ms: float = QUERY_EMBED_BATCH_WINDOW_MS, max_batch: int = QUERY_EMBED_MAX_BATCH):
+        self.embeddings = embeddings
+        self.window_seconds = window_ms / 1000
+        self.max_batch = max_batch
+        # created lazily so they bind to the running event loop
+        self.requests: Optional[asyncio.Queue] = None
+        self.batch_task: Optional[asyncio.Task] = None
+        self.stats = {"queries": 0, "batches": 0, "max_batch": 0, "model_seconds": 0.0}
+
+    @property
+    def model_name(self) -> str:
+        return self.embeddings.model_name
+
+    async def _run(self) -> None:
+        while True:
+            batch = [await self.requests.get()]
+            deadline = time.monotonic() + self.window_seconds
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.requests.get(), timeout=remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            started = time.perf_counter()
+            try:
+                vectors = await asyncio.to_thread(self.embeddings.embed_documents, [text for text, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.stats["queries"] += len(batch)
+            self.stats["batches"] += 1
+            self.stats["max_batch"] = max(self.stats["max_batch"], len(batch))
+            self.stats["model_seconds"] += time.perf_counter() - started
+            for (_, future), vector in zip(batch, vectors):
+                # a caller that was cancelled (client disconnect) no longer wants its vector
+                if not future.done():
+                    future.set_result(vector)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        if self.batch_task is None or self.batch_task.done():
+            self.requests = asyncio.Queue()
+            self.batch_task = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        await self.requests.put((text, future))
+        return await future
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def get_metrics(self) -> Dict:
+        batches = self.stats["batches"]
+        return {
+            **self.stats,
+            "avg_batch": self.stats["queries"] / batches if batches else 0.0,
+            "queued": self.requests.qsize() if self.requests else 0,
+            "window_ms": self.window_seconds * 1000,
+            "max_batch_size": self.max_batch
+        }
+
+
+class PrecomputedQueryEmbeddings(Embeddings):
+    """
+    Per-request view of an embeddings instance that answers embed_query for one query
+    with a vector computed earlier in the request (for the answer cache lookup), so
+    retrieval does not embed the same text again. Other texts go to the wrapped instance.
+    """
+
+    def __init__(self, embeddings: Embeddings, query: str, vector: List[float]):
+        self.embeddings = embeddings
+        self.query = query
+        self.vector = vector
+
+    @property
+    def model_name(self) -> str:
+        return self.embeddings.model_name
+
+    def embed_query(self, text: str) -> List[float]:
+        if text == self.query:
+            return self.vector
+        return self.embeddings.embed_query(text)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
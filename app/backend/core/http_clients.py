@@ -0,0 +1,143 @@
+"""
+Long-lived outbound HTTP clients, one per upstream API.
+Each client keeps a bounded keep-alive connection pool, so calls to GitHub, Clerk and
+Razorpay reuse TCP/TLS connections instead of handshaking per request. Clients are
+opened at startup (or on first use) and closed at shutdown.
+"""
+
+import os
+import time
+import importlib.util
+from typing import Dict
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "50"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("HTTP_KEEPALIVE_EXPIRY_SECONDS", "30"))
+# how long a request may wait for a free pooled connection before failing with PoolTimeout
+HTTP_POOL_TIMEOUT_SECONDS = float(os.getenv("HTTP_POOL_TIMEOUT_SECONDS", "5"))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "false").lower() == "true"
+
+UPSTREAMS = {
+    "github": {
+        "base_url": "https://api.github.com",
+        "timeout": float(os.getenv("GITHUB_HTTP_TIMEOUT_SECONDS", "10")),
+    },
+    "clerk": {
+        "base_url": "https://api.clerk.com/v1",
+        "timeout": float(os.getenv("CLERK_HTTP_TIMEOUT_SECONDS", "10")),
+    },
+    "razorpay": {
+        "base_url": "https://api.razorpay.com/v1",
+        "timeout": float(os.getenv("RAZORPAY_HTTP_TIMEOUT_SECONDS", "15")),
+    },
+}
+
+
+class InstrumentedTransport(httpx.AsyncBaseTransport):
+    """Wraps the pooled transport to count requests, errors, latency and concurrency"""
+
+    def __init__(self, transport: httpx.AsyncHTTPTransport, stats: Dict):
+        self.transport = transport
+        self.stats = stats
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        stats = self.stats
+        stats["requests"] += 1
+        stats["in_flight"] += 1
+        stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+        started = time.perf_counter()
+        try:
+            return await self.transport.handle_async_request(request)
+        except httpx.PoolTimeout:
+            stats["pool_timeouts"] += 1
+            stats["errors"] += 1
+            raise
+        except Exception:
+            stats["errors"] += 1
+            raise
+        finally:
+            stats["in_flight"] -= 1
+            stats["total_seconds"] += time.perf_counter() - started
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+class HTTPClientManager:
+    """Registry of pooled httpx clients keyed by upstream name."""
+
+    def __init__(self):
+        self.clients: Dict[str, httpx.AsyncClient] = {}
+        self.transports: Dict[str, httpx.AsyncHTTPTransport] = {}
+        self.stats: Dict[str, Dict] = {}
+        self.http2 = HTTP2_ENABLED and importlib.util.find_spec("h2") is not None
+        if HTTP2_ENABLED and not self.http2:
+            print("[HTTPClients] HTTP2_ENABLED is set but the h2 package is not installed, using HTTP/1.1")
+
+    def _create(self, name: str) -> httpx.AsyncClient:
+        upstream = UPSTREAMS[name]
+        transport = httpx.AsyncHTTPTransport(
+            http2=self.http2,
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_SECONDS
+            )
+        )
+        self.transports[name] = transport
+        self.stats.setdefault(name, {
+            "requests": 0, "errors": 0, "pool_timeouts": 0,
+            "in_flight": 0, "max_in_flight": 0, "total_seconds": 0.0
+        })
+        return httpx.AsyncClient(
+            base_url=upstream["base_url"],
+            timeout=httpx.Timeout(upstream["timeout"], pool=HTTP_POOL_TIMEOUT_SECONDS),
+            transport=InstrumentedTransport(transport, self.stats[name])
+        )
+
+    def get(self, name: str) -> httpx.AsyncClient:
+        client = self.clients.get(name)
+        if client is None:
+            client = self._create(name)
+            self.clients[name] = client
+        return client
+
+    async def start(self) -> None:
+        for name in UPSTREAMS:
+            self.get(name)
+        print(f"[HTTPClients] Opened pooled clients: {', '.join(UPSTREAMS)} (http2={self.http2})")
+
+    async def close(self) -> None:
+        for client in self.clients.values():
+            await client.aclose()
+        self.clients.clear()
+        self.transports.clear()
+
+    def get_metrics(self) -> Dict:
+        metrics = {}
+        for name, stats in self.stats.items():
+            open_connections = idle_connections = None
+            transport = self.transports.get(name)
+            try:
+                # httpcore pool internals; absent on older versions
+                connections = transport._pool.connections
+                open_connections = len(connections)
+                idle_connections = sum(1 for connection in connections if connection.is_idle())
+            except Exception:
+                pass
+            metrics[name] = {
+                **stats,
+                "avg_seconds": stats["total_seconds"] / stats["requests"] if stats["requests"] else 0.0,
+                "open_connections": open_connections,
+                "idle_connections": idle_connections,
+                "max_connections": HTTP_MAX_CONNECTIONS
+            }
+        return metrics
+
+
+# global instance
+http_clients = HTTPClientManager()
@@ -0,0 +1,60 @@
+"""
+Keyset (cursor) pagination helpers.
+Lists are ordered newest first by a timestamp field with _id as the tie-breaker; the
+cursor encodes the last item of a page, so each page is an index range scan instead of
+an ever-growing skip.
+"""
+
+import base64
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from bson import ObjectId
+from fastapi import HTTPException
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(timestamp: datetime, doc_id: ObjectId) -> str:
+    raw = f"{timestamp.isoformat()}|{doc_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
+    try:
+        timestamp, doc_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(timestamp), ObjectId(doc_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+
+
+def clamp_limit(limit: Optional[int]) -> int:
+    return max(1, min(limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE))
+
+
+def keyset_filter(query: Dict, field: str, cursor: Optional[str]) -> Dict:
+    """Restrict query to documents strictly after cursor in (field desc, _id desc) order"""
+    if not cursor:
+        return query
+    timestamp, doc_id = decode_cursor(cursor)
+    return {
+        "$and": [
+            query,
+            {"$or": [
+                {field: {"$lt": timestamp}},
+                {field: timestamp, "_id": {"$lt": doc_id}}
+            ]}
+        ]
+    }
+
+
+def keyset_sort(field: str) -> List[Tuple[str, int]]:
+    return [(field, -1), ("_id", -1)]
+
+
+def next_cursor(docs: List[Dict], field: str, limit: int) -> Optional[str]:
+    """Cursor for the page after docs, None if docs was the last page (fetch limit + 1 to detect it)"""
+    if len(docs) <= limit:
+        return None
+    last = docs[limit - 1]
+    return encode_cursor(last[field], last["_id"])
@@ -53,9 +53,9 @@ async def setup_collections_and_indexes():
         # ======== CHAT_SHARES INDEXES ========
         print("🔍 chat_shares indexes:")
         
-        # Index 1: Find chats shared with specific email
-        await db.chat_shares.create_index([("shared_with_email", 1), ("created_at", -1)])
-        print("   ✅ shared_with_email + created_at")
+        # Index 1: Find chats shared with specific email (keyset pagination on created_at, _id)
+        await db.chat_shares.create_index([("shared_with_email", 1), ("created_at", -1), ("_id", -1)])
+        print("   ✅ shared_with_email + created_at + _id")
         
         # Index 2: Find shares by org_id
         await db.chat_shares.create_index([("org_id", 1), ("created_at", -1)])
@@ -79,13 +79,13 @@ async def setup_collections_and_indexes():
         # ======== REPOSITORIES INDEXES ========
         print("\n🔍 repositories indexes:")
         
-        # Index 1: Personal repos (user_id + org_id=null)
-        await db.repositories.create_index([("user_id", 1), ("org_id", 1)])
-        print("   ✅ user_id + org_id")
+        # Index 1: Personal repos (user_id + org_id=null), keyset-paginated by ingested_at
+        await db.repositories.create_index([("user_id", 1), ("org_id", 1), ("ingested_at", -1), ("_id", -1)])
+        print("   ✅ user_id + org_id + ingested_at + _id")
         
-        # Index 2: Org repos
-        await db.repositories.create_index([("org_id", 1), ("ingested_at", -1)])
-        print("   ✅ org_id + ingested_at")
+        # Index 2: Org repos, keyset-paginated by ingested_at
+        await db.repositories.create_index([("org_id", 1), ("ingested_at", -1), ("_id", -1)])
+        print("   ✅ org_id + ingested_at + _id")
         
         # Index 3: Repo name + org isolation
         await db.repositories.create_index([("name", 1), ("org_id", 1)])
@@ -94,14 +94,18 @@ async def setup_collections_and_indexes():
         # ======== CHATS INDEXES ========
         print("\n🔍 chats indexes:")
         
-        # Index 1: User + repo isolation
-        await db.chats.create_index([("user_id", 1), ("repository_name", 1), ("created_at", -1)])
-        print("   ✅ user_id + repository_name + created_at")
+        # Index 1: User + repo isolation, keyset-paginated history
+        await db.chats.create_index([("user_id", 1), ("repository_name", 1), ("created_at", -1), ("_id", -1)])
+        print("   ✅ user_id + repository_name + created_at + _id")
         
         # Index 2: Org context
         await db.chats.create_index([("org_id", 1), ("user_id", 1)])
         print("   ✅ org_id + user_id")
         
+        # Index 3: Shared org history, keyset-paginated
+        await db.chats.create_index([("org_id", 1), ("repository_name", 1), ("created_at", -1), ("_id", -1)])
+        print("   ✅ org_id + repository_name + created_at + _id")
+        
         # ======== USAGE INDEXES ========
         print("\n🔍 usage indexes:")
         
@@ -120,12 +124,36 @@ async def setup_collections_and_indexes():
         await db.invitations.create_index([("org_id", 1), ("created_at", -1)])
         print("   ✅ org_id + created_at")
         
+        # ======== INGESTION_JOBS INDEXES ========
+        print("\n🔍 ingestion_jobs indexes:")
+        
+        # Index 1: Workers claim the oldest queued / lease-expired job
+        await db.ingestion_jobs.create_index([("status", 1), ("created_at", 1)])
+        print("   ✅ status + created_at")
+        
+        # Index 2: One active (queued/running) job per collection
+        await db.ingestion_jobs.create_index(
+            [("collection_name", 1)],
+            unique=True,
+            partialFilterExpression={"active": True}
+        )
+        print("   ✅ collection_name where active (unique)")
+        
+        # ======== EMBEDDING_CACHE INDEXES ========
+        print("\n🔍 embedding_cache indexes:")
+        
+        # Index 1: LRU eviction scans oldest entries first
+        await db.embedding_cache.create_index([("last_used_at", 1)])
+        print("   ✅ last_used_at")
+        
         print("\n\n✨ Database setup complete!")
         print("\nCreated collections:")
         print("  • chat_shares — for storing chat sharing between team members")
         print("  • organizations — for Team plan organizations")
         print("  • usage — for quota tracking")
         print("  • invitations — for org member invitations")
+        print("  • ingestion_jobs — queue consumed by worker.py")
+        print("  • embedding_cache — content-addressed chunk vectors shared across ingests")
         
         print("\nCreated indexes:")
         print("  • Isolation: org_id + user_id on all collections")
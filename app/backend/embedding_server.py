@@ -0,0 +1,149 @@
+"""
+Shared embedding server.
+Loads the dense embedding model once and serves every API and worker process on this
+host over a Unix socket (set EMBEDDING_BACKEND=server in those processes):
+
+    python embedding_server.py
+
+Requests that arrive within EMBEDDING_SERVER_MAX_WAIT_MS of each other are embedded in
+one forward pass (up to EMBEDDING_SERVER_MAX_BATCH texts), so concurrent chats and
+ingests share batches instead of each running their own.
+"""
+
+import asyncio
+import json
+import os
+import struct
+import time
+import numpy as np
+from dotenv import load_dotenv
+from core.embeddings import load_local_embeddings, EMBEDDING_SERVER_SOCKET
+
+load_dotenv()
+
+EMBEDDING_SERVER_MAX_BATCH = int(os.getenv("EMBEDDING_SERVER_MAX_BATCH", "64"))
+EMBEDDING_SERVER_MAX_WAIT_MS = float(os.getenv("EMBEDDING_SERVER_MAX_WAIT_MS", "5"))
+
+
+class BatchingEmbedder:
+    """Collects concurrent requests into shared model calls; one model call runs at a time."""
+
+    def __init__(self, model):
+        self.model = model
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.stats = {"requests": 0, "texts": 0, "batches": 0, "max_batch": 0, "model_seconds": 0.0}
+
+    async def embed(self, texts):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((texts, future))
+        return await future
+
+    async def run(self) -> None:
+        while True:
+            requests = [await self.queue.get()]
+            size = len(requests[0][0])
+            deadline = time.monotonic() + EMBEDDING_SERVER_MAX_WAIT_MS / 1000
+            # gather whatever else arrives within the window, up to the batch cap
+            while size < EMBEDDING_SERVER_MAX_BATCH:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    request = await asyncio.wait_for(self.queue.get(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    break
+                requests.append(request)
+                size += len(request[0])
+
+            texts = [text for request_texts, _ in requests for text in request_texts]
+            started = time.perf_counter()
+            try:
+                vectors = await asyncio.to_thread(self.model.embed_documents, texts)
+            except Exception as e:
+                for _, future in requests:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.stats["requests"] += len(requests)
+            self.stats["texts"] += len(texts)
+            self.stats["batches"] += 1
+            self.stats["max_batch"] = max(self.stats["max_batch"], len(texts))
+            self.stats["model_seconds"] += time.perf_counter() - started
+
+            offset = 0
+            for request_texts, future in requests:
+                if not future.done():
+                    future.set_result(vectors[offset:offset + len(request_texts)])
+                offset += len(request_texts)
+
+
+async def write_frame(writer: asyncio.StreamWriter, payload: bytes) -> None:
+    writer.write(struct.pack(">I", len(payload)) + payload)
+    await writer.drain()
+
+
+async def handle_connection(embedder: BatchingEmbedder, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    """One client connection; requests on it are answered in order"""
+    try:
+        while True:
+            try:
+                (size,) = struct.unpack(">I", await reader.readexactly(4))
+                request = json.loads(await reader.readexactly(size))
+            except asyncio.IncompleteReadError:
+                break
+
+            texts = request.get("texts") or []
+            try:
+                vectors = await embedder.embed(texts) if texts else []
+            except Exception as e:
+                await write_frame(writer, json.dumps({"error": str(e)}).encode())
+                continue
+
+            array = np.asarray(vectors, dtype="<f4")
+            dim = array.shape[1] if array.ndim == 2 else 0
+            await write_frame(writer, json.dumps({"count": len(vectors), "dim": dim}).encode())
+            await write_frame(writer, array.tobytes())
+    except Exception as e:
+        print(f"[EmbeddingServer] Connection error: {e}")
+    finally:
+        writer.close()
+
+
+async def report_stats(embedder: BatchingEmbedder) -> None:
+    while True:
+        await asyncio.sleep(60)
+        stats = embedder.stats
+        if stats["batches"]:
+            print(f"[EmbeddingServer] {stats['requests']} requests, {stats['texts']} texts in {stats['batches']} batches "
+                  f"(avg {stats['texts'] / stats['batches']:.1f}, max {stats['max_batch']}), "
+                  f"{stats['model_seconds']:.1f}s in the model")
+
+
+async def main():
+    print("[EmbeddingServer] Loading embeddings model...")
+    embedder = BatchingEmbedder(load_local_embeddings())
+
+    if os.path.exists(EMBEDDING_SERVER_SOCKET):
+        os.remove(EMBEDDING_SERVER_SOCKET)
+    server = await asyncio.start_unix_server(
+        lambda reader, writer: handle_connection(embedder, reader, writer),
+        path=EMBEDDING_SERVER_SOCKET
+    )
+    print(f"[EmbeddingServer] Listening on {EMBEDDING_SERVER_SOCKET} "
+          f"(max batch {EMBEDDING_SERVER_MAX_BATCH}, window {EMBEDDING_SERVER_MAX_WAIT_MS}ms)")
+
+    batcher = asyncio.create_task(embedder.run())
+    reporter = asyncio.create_task(report_stats(embedder))
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        batcher.cancel()
+        reporter.cancel()
+        if os.path.exists(EMBEDDING_SERVER_SOCKET):
+            os.remove(EMBEDDING_SERVER_SOCKET)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
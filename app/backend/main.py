@@ -1,25 +1,35 @@
 from fastapi import FastAPI, HTTPException, Depends, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 import uvicorn
-from services.ingestion import ingest_repo, get_collection_name
-from services.chat_service import get_chat_response
+from services.ingestion import get_collection_name, get_repo_name
+from services.ingestion_jobs import enqueue_ingestion_job, get_job, serialize_job
+from services.collection_manager import delete_repository_collections
+from services.chat_service import get_chat_response, stream_chat_response
 from services.user_service import update_github_token, get_or_create_user, get_github_token, disconnect_github
-from core.auth import get_current_user
+from core.auth import get_current_user, start_jwks_refresh, stop_jwks_refresh
 from core.database import connect_to_mongo, close_mongo_connection
+from core.http_clients import http_clients
+from core.chat_buffer import chat_write_buffer
+from core.pagination import DEFAULT_PAGE_SIZE, clamp_limit, keyset_filter, keyset_sort, next_cursor
 from models.schemas import ChatRequest, IngestRequest, GitHubConnectRequest, CreateSubscriptionRequest, CreateSubscriptionResponse, SubscriptionStatusResponse, ShareChatRequest, InviteRequest, OrgDetailsResponse, IngestRequestWithOrg
 from services.payment_service import payment_service
 from services.entitlement_service import entitlement_checker
-from services.org_service import require_org_access, invite_member, get_org_details, ensure_org_exists_in_db
+from services.org_service import require_org_access, invite_member, get_org_details, ensure_org_exists_in_db, require_org_membership, membership_resolver, reserve_org_quota, release_org_quota
 from bson import ObjectId
 from datetime import datetime
 import traceback
 import json
-import httpx
-import os
 
 app = FastAPI(title="infralens backend")
-CLERK_API_KEY = os.getenv("CLERK_API_KEY")
+
+# repository list views never need file hashes or collection bookkeeping
+REPOSITORY_LIST_FIELDS = {
+    "name": 1, "github_url": 1, "user_id": 1, "org_id": 1, "is_private": 1,
+    "files_processed": 1, "chunks_stored": 1, "last_commit_sha": 1, "ingested_at": 1
+}
+REPOSITORY_SUMMARY_FIELDS = {"name": 1, "github_url": 1, "ingested_at": 1}
 
 app.add_middleware(
     CORSMiddleware,
@@ -38,27 +48,48 @@ app.add_middleware(
 async def startup_event():
     print("Connecting to MongoDB...")
     await connect_to_mongo()
+    await http_clients.start()
+    await start_jwks_refresh()
+    await chat_write_buffer.start()
     print("Startup: Loading ML models...")
-    from services.chat_service import get_llm, get_embeddings
+    from services.chat_service import get_llm, get_embeddings, get_sparse_embeddings, get_qdrant_client
     
     # trigger model loading
     get_embeddings()
+    get_sparse_embeddings()
     get_llm()
+    get_qdrant_client()
     print("Startup: ML models loaded and cached!")
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    from services.chat_service import retrieval_executor
+    retrieval_executor.shutdown(wait=False)
+    await stop_jwks_refresh()
+    # write buffered chats before the Mongo client goes away
+    await chat_write_buffer.stop()
+    await http_clients.close()
     await close_mongo_connection()
 
 @app.get("/health")
 async def health_check():
     return {"status": "active", "service": "InfraLens API"}
 
+@app.get("/metrics")
+async def metrics():
+    """Process-local counters for outbound HTTP connection pools, query embedding batches and the chat write buffer"""
+    from services.chat_service import get_embeddings
+    embeddings = get_embeddings()
+    return {
+        "http_clients": http_clients.get_metrics(),
+        "query_embeddings": embeddings.get_metrics() if hasattr(embeddings, "get_metrics") else None,
+        "chat_writes": chat_write_buffer.get_metrics()
+    }
+
 @app.post("/api/ingest")
 async def ingest_endpoint(request: IngestRequestWithOrg, current_user: dict = Depends(get_current_user)):
     try:
         from core.database import get_database
-        from datetime import datetime
         
         db = get_database()
         user_id = current_user["user_id"]
@@ -68,94 +99,67 @@ async def ingest_endpoint(request: IngestRequestWithOrg, current_user: dict = De
         print(f"Starting ingestion for: {request.repo_url} by user: {user_id}, org: {org_id}")
         
         if org_id:
-            await ensure_org_exists_in_db(org_id, db, current_user)
-            
-            jwt_org_role = current_user.get("org_role")
-            has_org_access_from_jwt = (jwt_org_role in ["org:owner", "org:admin", "org:member"])
-            
-            org = await db.organizations.find_one({"org_id": org_id})
-            is_owner = org and org.get("owner_user_id") == user_id
-            is_member_in_db = org and user_id in org.get("member_user_ids", [])            
-            has_access = is_owner or has_org_access_from_jwt or is_member_in_db
-            
-            if not has_access and not is_owner:
-                try:
-                    if CLERK_API_KEY:
-                        async with httpx.AsyncClient() as client:
-                            # Get org members from Clerk
-                            response = await client.get(
-                                f"https://api.clerk.com/v1/organizations/{org_id}/memberships",
-                                headers={"Authorization": f"Bearer {CLERK_API_KEY}"}
-                            )
-                            if response.status_code == 200:
-                                memberships = response.json()
-                                # check if user is a member in Clerk
-                                for membership in memberships.get("data", []):
-                                    member_user_id = membership.get("public_user_data", {}).get("user_id")
-                                    if member_user_id == user_id:
-                                        has_access = True
-                                        # sync to MongoDB
-                                        if org:
-                                            await db.organizations.update_one(
-                                                {"org_id": org_id},
-                                                {
-                                                    "$addToSet": {"member_user_ids": user_id},
-                                                    "$set": {"updated_at": datetime.utcnow()}
-                                                }
-                                            )
-                                        print(f"[Ingest] Synced {user_id} to org {org_id} (from Clerk memberships)")
-                                        break
-                except Exception as e:
-                    print(f"[Ingest] Warning: Could not verify Clerk membership: {e}")
-            
-            if not org or not has_access:
-                raise HTTPException(status_code=403, detail="You are not authorized to ingest repos for this organization")
-            
-            # sync JWT membership to MongoDB
-            if has_org_access_from_jwt and not is_member_in_db and not is_owner:
-                await db.organizations.update_one(
-                    {"org_id": org_id},
-                    {
-                        "$addToSet": {"member_user_ids": user_id},
-                        "$set": {"updated_at": datetime.utcnow()}
-                    }
-                )
-            
-            # Check org quota before ingestion
-            month_key = datetime.utcnow().strftime("%Y-%m")
-            usage = await db.usage.find_one({"org_id": org_id, "month": month_key})
+            org = await require_org_membership(
+                org_id, current_user, db,
+                detail="You are not authorized to ingest repos for this organization",
+                ensure_exists=True
+            )
             
-            if usage and usage.get("repos_ingested", 0) >= org.get("ingestion_quota_monthly", 100):
-                raise HTTPException(
-                    status_code=402,
-                    detail=f"Organization quota reached ({org.get('ingestion_quota_monthly', 100)} repos/month). Upgrade to ingest more."
-                )
-        
-        result = await ingest_repo(request.repo_url, user_id, org_id=org_id)
-        print(f"Ingestion result: {result}")
+            # take a quota slot up front (one atomic write); given back if the job fails
+            quota_month = await reserve_org_quota(org_id, org, db)
+        else:
+            quota_month = None
         
-        if result["status"] == "error":
-             raise HTTPException(status_code=400, detail=result["message"])
+        owner_type, owner_id = ("org", org_id) if org_id else ("usr", user_id)
+        collection_name = get_collection_name(owner_type, owner_id, get_repo_name(request.repo_url))
         
-        # increment org quota after successful ingest
-        if org_id:
-            month_key = datetime.utcnow().strftime("%Y-%m")
-            await db.usage.update_one(
-                {"org_id": org_id, "month": month_key},
-                {
-                    "$inc": {"repos_ingested": 1},
-                    "$set": {"org_id": org_id, "month": month_key, "updated_at": datetime.utcnow()}
-                },
-                upsert=True
-            )
+        # clone/chunk/embed run in worker.py; the worker releases the quota slot if the job fails
+        try:
+            job = await enqueue_ingestion_job(request.repo_url, user_id, org_id, collection_name, db, quota_month=quota_month)
+        except Exception:
+            if quota_month:
+                await release_org_quota(org_id, quota_month, db)
+            raise
+        if job.get("deduplicated") and quota_month:
+            # an ingest for this repo is already queued or running and holds its own slot
+            await release_org_quota(org_id, quota_month, db)
+        print(f"Queued ingestion job {job['_id']} for {collection_name}")
         
-        return result
+        return {
+            "status": "queued",
+            "job_id": str(job["_id"]),
+            "message": "Repository queued for ingestion"
+        }
     except HTTPException:
         raise
     except Exception as e:
         print(f"Exception in ingest_endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/ingest/jobs/{job_id}")
+async def get_ingest_job(job_id: str, current_user: dict = Depends(get_current_user)):
+    """Poll an ingestion job's status and current stage"""
+    try:
+        from core.database import get_database
+        db = get_database()
+        
+        job = await get_job(job_id, db)
+        if not job:
+            raise HTTPException(status_code=404, detail="Ingestion job not found")
+        
+        # requester, or anyone working in the job's org workspace
+        is_requester = job["user_id"] == current_user["user_id"]
+        is_same_org = job.get("org_id") and job["org_id"] == current_user.get("org_id")
+        if not is_requester and not is_same_org:
+            raise HTTPException(status_code=404, detail="Ingestion job not found")
+        
+        return serialize_job(job)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Exception in get_ingest_job: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/api/github/connect")
 async def connect_github(request: GitHubConnectRequest, current_user: dict = Depends(get_current_user)):
     """Store GitHub OAuth token for private repo access"""
@@ -228,6 +232,37 @@ async def github_status(current_user: dict = Depends(get_current_user)):
 async def health_check():
     return {"status": "active", "service": "InfraLens API"}
 
+async def authorize_chat_repository(repository_name: str, current_user: dict, db) -> dict:
+    """Load the repository a chat targets and enforce workspace isolation (raises HTTPException)"""
+    user_id = current_user["user_id"]
+    # validate access to repository
+    repo = await db.repositories.find_one({"name": repository_name}, {"user_id": 1, "org_id": 1})
+    if not repo:
+        raise HTTPException(status_code=404, detail="Repository not found")
+
+    print(f"[Chat] Found repo - user_id: {repo.get('user_id')}, org_id: {repo.get('org_id')}")
+
+    # workspace isolation
+    repo_user_id = repo.get("user_id")
+    repo_org_id = repo.get("org_id")
+
+    # personal repo
+    if repo_org_id is None and repo_user_id:
+        if repo_user_id != user_id:
+            raise HTTPException(status_code=403, detail="You do not have access to this repository")
+        print(f"[Chat] ✓ Personal repo access granted")
+
+    # validate user is owner or member
+    if repo_org_id:
+        await require_org_membership(
+            repo_org_id, current_user, db,
+            detail="You are not authorized to access this organization's repository",
+            ensure_exists=True
+        )
+        print(f"[Chat] ✓ Org repo access granted")
+
+    return repo
+
 @app.post("/api/chat")
 async def chat_endpoint(request: ChatRequest, current_user: dict = Depends(get_current_user)):
     user_msg = request.message
@@ -242,99 +277,70 @@ async def chat_endpoint(request: ChatRequest, current_user: dict = Depends(get_c
         print(f"[Chat] User: {user_id}, Org: {org_id}, Repository: {request.repository_name}")
         print(f"[Chat] Message: {user_msg[:50]}...")
         
-        # validate access to repository
-        repo = await db.repositories.find_one({"name": request.repository_name})
-        if not repo:
-            raise HTTPException(status_code=404, detail="Repository not found")
-        
-        print(f"[Chat] Found repo - user_id: {repo.get('user_id')}, org_id: {repo.get('org_id')}")
-        
-        # workspace isolation
-        repo_user_id = repo.get("user_id")
-        repo_org_id = repo.get("org_id")
-        
-        # personal repo
-        if repo_org_id is None and repo_user_id:
-            if repo_user_id != user_id:
-                raise HTTPException(status_code=403, detail="You do not have access to this repository")
-            print(f"[Chat] ✓ Personal repo access granted")
-        
-        # validate user is owner or member
-        if repo_org_id:
-            await ensure_org_exists_in_db(repo_org_id, db, current_user)
-            
-            jwt_org_role = current_user.get("org_role")
-            has_org_access_from_jwt = (jwt_org_role in ["org:owner", "org:admin", "org:member"])
-            
-            org = await db.organizations.find_one({"org_id": repo_org_id})
-            is_owner = org and org.get("owner_user_id") == user_id
-            is_member_in_db = org and user_id in org.get("member_user_ids", [])
-            has_access = is_owner or has_org_access_from_jwt or is_member_in_db
-            
-            if not has_access and not is_owner:
-                try:
-                    clerk_api_key = os.getenv("CLERK_API_KEY")
-                    if clerk_api_key:
-                        async with httpx.AsyncClient() as client:
-                            # Get org members from Clerk
-                            response = await client.get(
-                                f"https://api.clerk.com/v1/organizations/{repo_org_id}/memberships",
-                                headers={"Authorization": f"Bearer {clerk_api_key}"}
-                            )
-                            if response.status_code == 200:
-                                memberships = response.json()
-                                # check if user is a member in Clerk
-                                for membership in memberships.get("data", []):
-                                    member_user_id = membership.get("public_user_data", {}).get("user_id")
-                                    if member_user_id == user_id:
-                                        has_access = True
-                                        # sync to MongoDB
-                                        if org:
-                                            await db.organizations.update_one(
-                                                {"org_id": repo_org_id},
-                                                {
-                                                    "$addToSet": {"member_user_ids": user_id},
-                                                    "$set": {"updated_at": datetime.utcnow()}
-                                                }
-                                            )
-                                        print(f"[Chat] Synced {user_id} to org {repo_org_id} (from Clerk memberships)")
-                                        break
-                except Exception as e:
-                    print(f"[Chat] Warning: Could not verify Clerk membership: {e}")
-            
-            if not org or not has_access:
-                print(f"[Chat] ✗ Not org member (owner={is_owner}, jwt_role={jwt_org_role}, in_db={is_member_in_db})")
-                raise HTTPException(status_code=403, detail="You are not authorized to access this organization's repository")
-            
-            if has_org_access_from_jwt and not is_member_in_db and not is_owner:
-                await db.organizations.update_one(
-                    {"org_id": repo_org_id},
-                    {
-                        "$addToSet": {"member_user_ids": user_id},
-                        "$set": {"updated_at": datetime.utcnow()}
-                    }
-                )
-                print(f"[Chat] Synced {user_id} to org {repo_org_id} member list")
-            
-            print(f"[Chat] ✓ Org repo access granted")
+        repo = await authorize_chat_repository(request.repository_name, current_user, db)
         
         # chat shared across all org members, use org_id
         chat_org_id = repo.get("org_id") if repo else None
-        ai_response = await get_chat_response(user_msg, user_id, request.repository_name, org_id=chat_org_id)
-        return {"response": ai_response}
+        return await get_chat_response(user_msg, user_id, request.repository_name, org_id=chat_org_id)
     except HTTPException:
         raise
     except Exception as e:
         print(f"Exception in chat_endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest, current_user: dict = Depends(get_current_user)):
+    """Same as /api/chat, streamed as Server-Sent Events: sources, then tokens, then done"""
+    user_msg = request.message
+    user_id = current_user["user_id"]
+
+    try:
+        from core.database import get_database
+        db = get_database()
+
+        print(f"[Chat] Streaming for user: {user_id}, Repository: {request.repository_name}")
+        # access errors are returned as regular HTTP errors before the stream starts
+        repo = await authorize_chat_repository(request.repository_name, current_user, db)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Exception in chat_stream_endpoint: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    chat_org_id = repo.get("org_id")
+
+    async def event_stream():
+        try:
+            async for event in stream_chat_response(user_msg, user_id, request.repository_name, org_id=chat_org_id):
+                yield f"event: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+        except Exception as e:
+            print(f"Exception in chat stream: {str(e)}")
+            yield f"event: error\ndata: {json.dumps({'message': str(e)})}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        # keep proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/api/repositories")
-async def get_repositories(workspace_type: str = "personal", org_id: str = None, current_user: dict = Depends(get_current_user)):
+async def get_repositories(
+    workspace_type: str = "personal",
+    org_id: str = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: str = None,
+    summary: bool = False,
+    current_user: dict = Depends(get_current_user)
+):
     """Get repositories for current workspace (strict isolation).
     
     Args:
         workspace_type: "personal" or "org" (default: "personal")
         org_id: Optional org_id from query param (overrides JWT org_id)
+        limit: page size (max 100)
+        cursor: next_cursor from the previous page
+        summary: only return _id, name, github_url and ingested_at
     """
     try:
         from core.database import get_database
@@ -343,13 +349,13 @@ async def get_repositories(workspace_type: str = "personal", org_id: str = None,
         jwt_org_id = current_user.get("org_id")        
         final_org_id = org_id or jwt_org_id
         
-        repositories = []
+        limit = clamp_limit(limit)
+        projection = REPOSITORY_SUMMARY_FIELDS if summary else REPOSITORY_LIST_FIELDS
+        query = None
         
         # personal workspace
         if workspace_type == "personal":
-            repositories = await db.repositories.find(
-                {"user_id": user_id, "org_id": None}
-            ).sort("ingested_at", -1).to_list(length=100)
+            query = {"user_id": user_id, "org_id": None}
         
         # Org workspace 
         elif workspace_type == "org":
@@ -357,82 +363,27 @@ async def get_repositories(workspace_type: str = "personal", org_id: str = None,
                 raise HTTPException(status_code=400, detail="No organization selected")
             print(f"        user_id={user_id}, org_id={final_org_id}")
             
-            await ensure_org_exists_in_db(final_org_id, db, current_user)
-            
-            # validate user is org owner or member
-            jwt_org_role = current_user.get("org_role")
-            has_org_access_from_jwt = (jwt_org_role in ["org:owner", "org:admin", "org:member"])
-            
-            org = await db.organizations.find_one({"org_id": final_org_id})
-            is_owner = org and org.get("owner_user_id") == user_id
-            is_member_in_db = org and user_id in org.get("member_user_ids", [])
-            has_access = is_owner or has_org_access_from_jwt or is_member_in_db
-            
-            if not has_access and not is_owner:
-                try:
-                    if CLERK_API_KEY:
-                        async with httpx.AsyncClient() as client:
-                            # Get org members from Clerk
-                            response = await client.get(
-                                f"https://api.clerk.com/v1/organizations/{final_org_id}/memberships",
-                                headers={"Authorization": f"Bearer {CLERK_API_KEY}"}
-                            )
-                            if response.status_code == 200:
-                                memberships = response.json()
-                                found = False
-                                for i, membership in enumerate(memberships.get("data", [])):
-                                    print(json.dumps(membership, indent=2, default=str))
-                                    
-                                    member_id = membership.get("public_user_data", {}).get("user_id")
-                                    role = membership.get("role")
-                                    
-                                    if member_id == user_id:
-                                        has_access = True
-                                        found = True
-                                        # Sync to MongoDB
-                                        if org:
-                                            await db.organizations.update_one(
-                                                {"org_id": final_org_id},
-                                                {
-                                                    "$addToSet": {"member_user_ids": user_id},
-                                                    "$set": {"updated_at": datetime.utcnow()}
-                                                }
-                                            )
-                                        print(f"[Auth] Synced {user_id} to org {final_org_id} (from Clerk memberships)")
-                                        break
-                    else:
-                        print(f"[ERROR] CLERK_API_KEY not set! Cannot verify membership via Clerk")
-                except Exception as e:
-                    print(f"[Auth] Warning: Could not verify Clerk membership: {e}")
-                    traceback.print_exc()
-            
-            if not org or not has_access:
-                raise HTTPException(status_code=403, detail="You are not authorized to access this organization")
-            
-            if (has_org_access_from_jwt or is_member_in_db) and not is_member_in_db and not is_owner:
-                await db.organizations.update_one(
-                    {"org_id": final_org_id},
-                    {
-                        "$addToSet": {"member_user_ids": user_id},
-                        "$set": {"updated_at": datetime.utcnow()}
-                    }
-                )
-                print(f"[Auth] Synced {user_id} to org {final_org_id} member list (from JWT org_role)")
+            await require_org_membership(final_org_id, current_user, db, ensure_exists=True)
             
             # Return ONLY org repos, never personal repos
-            repositories = await db.repositories.find(
-                {"org_id": final_org_id}
-            ).sort("ingested_at", -1).to_list(length=100)
+            query = {"org_id": final_org_id}
         
         else:
             raise HTTPException(status_code=400, detail="Invalid workspace_type. Use 'personal' or 'org'")
         
+        repositories = await db.repositories.find(
+            keyset_filter(query, "ingested_at", cursor),
+            projection
+        ).sort(keyset_sort("ingested_at")).limit(limit + 1).to_list(length=limit + 1)
+        page_cursor = next_cursor(repositories, "ingested_at", limit)
+        repositories = repositories[:limit]
+        
         # Format response
         for repo in repositories:
             repo["_id"] = str(repo["_id"])
             repo["ingested_at"] = repo["ingested_at"].isoformat()
         
-        return {"repositories": repositories}
+        return {"repositories": repositories, "next_cursor": page_cursor}
     except HTTPException:
         raise
     except Exception as e:
@@ -441,8 +392,20 @@ async def get_repositories(workspace_type: str = "personal", org_id: str = None,
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/chat/history/{repository_name}")
-async def get_chat_history(repository_name: str, current_user: dict = Depends(get_current_user)):
-    """Get chat history for a specific repository with workspace isolation"""
+async def get_chat_history(
+    repository_name: str,
+    limit: int = 10,
+    cursor: str = None,
+    summary: bool = False,
+    current_user: dict = Depends(get_current_user)
+):
+    """Get chat history for a specific repository with workspace isolation
+    
+    Args:
+        limit: number of chats per page, newest first (max 100)
+        cursor: next_cursor from the previous page, to load older chats
+        summary: return one entry per chat with its opening question instead of all messages
+    """
     try:
         from core.database import get_database
         db = get_database()
@@ -451,7 +414,7 @@ async def get_chat_history(repository_name: str, current_user: dict = Depends(ge
         final_org_id = current_user.get("org_id")
         
         # validate access to repo
-        repo = await db.repositories.find_one({"name": repository_name})
+        repo = await db.repositories.find_one({"name": repository_name}, {"user_id": 1, "org_id": 1})
         if not repo:
             raise HTTPException(status_code=404, detail="Repository not found")
         
@@ -466,76 +429,42 @@ async def get_chat_history(repository_name: str, current_user: dict = Depends(ge
         
         # validate user is owner or member
         if repo_org_id:
-            await ensure_org_exists_in_db(repo_org_id, db, current_user)
-            
-            jwt_org_role = current_user.get("org_role")
-            has_org_access_from_jwt = (jwt_org_role in ["org:owner", "org:admin", "org:member"])
-            
-            org = await db.organizations.find_one({"org_id": repo_org_id})
-            is_owner = org and org.get("owner_user_id") == user_id
-            is_member_in_db = org and user_id in org.get("member_user_ids", [])
-            
-            has_access = is_owner or has_org_access_from_jwt or is_member_in_db
-            
-            if not has_access and not is_owner:
-                import httpx
-                import os
-                try:
-                    clerk_api_key = os.getenv("CLERK_API_KEY")
-                    if clerk_api_key:
-                        async with httpx.AsyncClient() as client:
-                            # Get org members from Clerk
-                            response = await client.get(
-                                f"https://api.clerk.com/v1/organizations/{repo_org_id}/memberships",
-                                headers={"Authorization": f"Bearer {clerk_api_key}"}
-                            )
-                            if response.status_code == 200:
-                                memberships = response.json()
-                                # Check if user is a member in Clerk
-                                for membership in memberships.get("data", []):
-                                    member_user_id = membership.get("public_user_data", {}).get("user_id")
-                                    if member_user_id == user_id:
-                                        # User is a member in Clerk, grant access
-                                        has_access = True
-                                        # Sync to MongoDB
-                                        if org:
-                                            await db.organizations.update_one(
-                                                {"org_id": repo_org_id},
-                                                {
-                                                    "$addToSet": {"member_user_ids": user_id},
-                                                    "$set": {"updated_at": datetime.utcnow()}
-                                                }
-                                            )
-                                        print(f"[ChatHistory] Synced {user_id} to org {repo_org_id} (from Clerk memberships)")
-                                        break
-                except Exception as e:
-                    print(f"[ChatHistory] Warning: Could not verify Clerk membership: {e}")
-            
-            if not org or not has_access:
-                raise HTTPException(status_code=403, detail="You are not authorized to access this organization's repository")
-            
-            if has_org_access_from_jwt and not is_member_in_db and not is_owner:
-                await db.organizations.update_one(
-                    {"org_id": repo_org_id},
-                    {
-                        "$addToSet": {"member_user_ids": user_id},
-                        "$set": {"updated_at": datetime.utcnow()}
-                    }
-                )
+            await require_org_membership(
+                repo_org_id, current_user, db,
+                detail="You are not authorized to access this organization's repository",
+                ensure_exists=True
+            )
         
         # For org repos, all members see the same chat history
         if repo_org_id:
-            chats = await db.chats.find({
-                "org_id": repo_org_id,
-                "repository_name": repository_name
-            }).sort("created_at", -1).limit(10).to_list(length=10)
-            print(f"[ChatHistory] Retrieved chat history for org repo: org_id={repo_org_id}, repo={repository_name}")
+            scope = {"org_id": repo_org_id, "repository_name": repository_name}
         else:
-            chats = await db.chats.find({
-                "user_id": user_id,
-                "repository_name": repository_name
-            }).sort("created_at", -1).limit(10).to_list(length=10)
-            print(f"[ChatHistory] Retrieved chat history for personal repo: user_id={user_id}, repo={repository_name}")
+            scope = {"user_id": user_id, "repository_name": repository_name}
+        
+        limit = clamp_limit(limit)
+        projection = {"created_at": 1, "messages": {"$slice": 1}} if summary else {
+            "created_at": 1, "messages.role": 1, "messages.content": 1, "messages.timestamp": 1
+        }
+        chats = await db.chats.find(
+            keyset_filter(scope, "created_at", cursor),
+            projection
+        ).sort(keyset_sort("created_at")).limit(limit + 1).to_list(length=limit + 1)
+        page_cursor = next_cursor(chats, "created_at", limit)
+        chats = chats[:limit]
+        print(f"[ChatHistory] Retrieved {len(chats)} chats for {scope}")
+        
+        if summary:
+            return {
+                "chats": [
+                    {
+                        "chat_id": str(chat["_id"]),
+                        "created_at": chat["created_at"].isoformat(),
+                        "question": chat["messages"][0]["content"][:200] if chat.get("messages") else None
+                    }
+                    for chat in chats
+                ],
+                "next_cursor": page_cursor
+            }
         
         # extract messages
         all_messages = []
@@ -547,7 +476,7 @@ async def get_chat_history(repository_name: str, current_user: dict = Depends(ge
                     "timestamp": msg["timestamp"].isoformat() if "timestamp" in msg else None
                 })
         
-        return {"messages": all_messages}
+        return {"messages": all_messages, "next_cursor": page_cursor}
     except HTTPException:
         raise
     except Exception as e:
@@ -555,8 +484,13 @@ async def get_chat_history(repository_name: str, current_user: dict = Depends(ge
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/chat/shared-with-me")
-async def get_shared_chats(current_user: dict = Depends(get_current_user)):
-    """Get list of chats shared with the current user"""
+async def get_shared_chats(limit: int = DEFAULT_PAGE_SIZE, cursor: str = None, current_user: dict = Depends(get_current_user)):
+    """Get list of chats shared with the current user
+    
+    Args:
+        limit: page size (max 100)
+        cursor: next_cursor from the previous page
+    """
     try:
         from core.database import get_database
         
@@ -564,22 +498,38 @@ async def get_shared_chats(current_user: dict = Depends(get_current_user)):
         user_email = current_user.get("email")
         
         if not user_email:
-            return {"shared_chats": []}
+            return {"shared_chats": [], "next_cursor": None}
         
-        # all chats shared with this user's email
+        limit = clamp_limit(limit)
+        
+        # one page of shares for this user's email, newest first
         shared_chats = await db.chat_shares.find(
-            {"shared_with_email": user_email}
-        ).sort("created_at", -1).to_list(length=50)
+            keyset_filter({"shared_with_email": user_email}, "created_at", cursor),
+            {"chat_session_id": 1, "repository_name": 1, "shared_by_user_id": 1, "created_at": 1, "access_level": 1}
+        ).sort(keyset_sort("created_at")).limit(limit + 1).to_list(length=limit + 1)
+        page_cursor = next_cursor(shared_chats, "created_at", limit)
+        shared_chats = shared_chats[:limit]
+        
+        # session ids may be stored as ObjectId hex or as plain strings
+        def chat_key(session_id):
+            return ObjectId(session_id) if ObjectId.is_valid(session_id) else session_id
+        
+        # fetch all shared chats in one query instead of one per share
+        chat_ids = list({chat_key(share["chat_session_id"]) for share in shared_chats})
+        chats = {}
+        if chat_ids:
+            async for chat in db.chats.find(
+                {"_id": {"$in": chat_ids}},
+                {"repository_name": 1, "messages.role": 1, "messages.content": 1, "messages.timestamp": 1}
+            ):
+                chats[chat["_id"]] = chat
         
         # enrich with actual chat messages
         enriched_chats = []
         for share in shared_chats:
-            chat = await db.chats.find_one({
-                "_id": ObjectId(share["chat_session_id"]) if share["chat_session_id"].startswith("ObjectId") else share["chat_session_id"],
-                "repository_name": share["repository_name"]
-            })
+            chat = chats.get(chat_key(share["chat_session_id"]))
             
-            if chat:
+            if chat and chat.get("repository_name") == share["repository_name"]:
                 messages = []
                 for msg in chat.get("messages", []):
                     messages.append({
@@ -597,8 +547,10 @@ async def get_shared_chats(current_user: dict = Depends(get_current_user)):
                     "messages": messages
                 })
         
-        return {"shared_chats": enriched_chats}
+        return {"shared_chats": enriched_chats, "next_cursor": page_cursor}
     
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Exception in get_shared_chats: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -609,8 +561,8 @@ async def delete_repository(repo_id: str, current_user: dict = Depends(get_curre
     try:
         from core.database import get_database
         from bson import ObjectId
-        from qdrant_client import QdrantClient
-        import os
+        from services.chat_service import get_qdrant_client, evict_vector_stores
+        from core.answer_cache import answer_cache
         
         db = get_database()
         user_id = current_user["user_id"]
@@ -631,61 +583,18 @@ async def delete_repository(repo_id: str, current_user: dict = Depends(get_curre
             
         # org repo access
         elif repo.get("org_id"):
-            jwt_org_role = current_user.get("org_role")
-            has_org_access_from_jwt = (jwt_org_role in ["org:owner", "org:admin", "org:member"])
-            
-            org = await db.organizations.find_one({"org_id": repo["org_id"]})
-            is_owner = org and org.get("owner_user_id") == user_id
-            is_member_in_db = org and user_id in org.get("member_user_ids", [])
-            
-            has_access = is_owner or has_org_access_from_jwt or is_member_in_db
-            
-            if not has_access and not is_owner:
-                try:
-                    clerk_api_key = os.getenv("CLERK_API_KEY")
-                    if clerk_api_key:
-                        async with httpx.AsyncClient() as client:
-                            # Get org members from Clerk
-                            response = await client.get(
-                                f"https://api.clerk.com/v1/organizations/{repo['org_id']}/memberships",
-                                headers={"Authorization": f"Bearer {clerk_api_key}"}
-                            )
-                            if response.status_code == 200:
-                                memberships = response.json()
-                                # Check if user is a member in Clerk
-                                for membership in memberships.get("data", []):
-                                    member_user_id = membership.get("public_user_data", {}).get("user_id")
-                                    if member_user_id == user_id:
-                                        # User is a member in Clerk, grant access
-                                        has_access = True
-                                        # Sync to MongoDB
-                                        if org:
-                                            await db.organizations.update_one(
-                                                {"org_id": repo["org_id"]},
-                                                {
-                                                    "$addToSet": {"member_user_ids": user_id},
-                                                    "$set": {"updated_at": datetime.utcnow()}
-                                                }
-                                            )
-                                        print(f"[Delete] Synced {user_id} to org {repo['org_id']} (from Clerk memberships)")
-                                        break
-                except Exception as e:
-                    print(f"[Delete] Warning: Could not verify Clerk membership: {e}")
-            
-            if not org or not has_access:
-                raise HTTPException(status_code=403, detail="You do not have access to this organization's repository")
+            await require_org_membership(
+                repo["org_id"], current_user, db,
+                detail="You do not have access to this organization's repository"
+            )
         else:
             raise HTTPException(status_code=404, detail="Repository not found")
         
-        collection_name = repo["collection_name"]
-        
-        # del from qdrant
+        # del from qdrant (alias, serving collection and retired versions)
         try:
-            qdrant_url = os.getenv("QDRANT_URL", "http://localhost:6333")
-            qdrant_api_key = os.getenv("QDRANT_API_KEY")
-            qdrant_client = QdrantClient(url=qdrant_url, api_key=qdrant_api_key)
-            qdrant_client.delete_collection(collection_name=collection_name)
-            print(f"Deleted Qdrant collection: {collection_name}")
+            evict_vector_stores(repo)
+            answer_cache.invalidate(repo["collection_name"])
+            delete_repository_collections(get_qdrant_client(), repo)
         except Exception as e:
             print(f"Warning: Failed to delete Qdrant collection: {e}")
         
@@ -789,7 +698,6 @@ async def share_chat(
     """Share a chat session with team members (workspace sharing)."""
     try:
         from core.database import get_database
-        from datetime import datetime
         
         db = get_database()
         user_id = current_user["user_id"]
@@ -803,58 +711,7 @@ async def share_chat(
             )
         
         # Validate org exists and user is member or owner
-        jwt_org_role = current_user.get("org_role")
-        has_org_access_from_jwt = (jwt_org_role in ["org:owner", "org:admin", "org:member"])
-        
-        org = await db.organizations.find_one({"org_id": org_id})
-        is_owner = org and org.get("owner_user_id") == user_id
-        is_member_in_db = org and user_id in org.get("member_user_ids", [])
-        
-        has_access = is_owner or has_org_access_from_jwt or is_member_in_db
-        
-        if not has_access and not is_owner:
-            try:
-                clerk_api_key = os.getenv("CLERK_API_KEY")
-                if clerk_api_key:
-                    async with httpx.AsyncClient() as client:
-                        # Get org members from Clerk
-                        response = await client.get(
-                            f"https://api.clerk.com/v1/organizations/{org_id}/memberships",
-                            headers={"Authorization": f"Bearer {clerk_api_key}"}
-                        )
-                        if response.status_code == 200:
-                            memberships = response.json()
-                            # Check if user is a member in Clerk
-                            for membership in memberships.get("data", []):
-                                member_user_id = membership.get("public_user_data", {}).get("user_id")
-                                if member_user_id == user_id:
-                                    # User is a member in Clerk, grant access
-                                    has_access = True
-                                    # Sync to MongoDB
-                                    if org:
-                                        await db.organizations.update_one(
-                                            {"org_id": org_id},
-                                            {
-                                                "$addToSet": {"member_user_ids": user_id},
-                                                "$set": {"updated_at": datetime.utcnow()}
-                                            }
-                                        )
-                                    print(f"[Share] Synced {user_id} to org {org_id} (from Clerk memberships)")
-                                    break
-            except Exception as e:
-                print(f"[Share] Warning: Could not verify Clerk membership: {e}")
-        
-        if not org or not has_access:
-            raise HTTPException(status_code=403, detail="You are not authorized to access this organization")
-        
-        if has_org_access_from_jwt and not is_member_in_db and not is_owner:
-            await db.organizations.update_one(
-                {"org_id": org_id},
-                {
-                    "$addToSet": {"member_user_ids": user_id},
-                    "$set": {"updated_at": datetime.utcnow()}
-                }
-            )
+        await require_org_membership(org_id, current_user, db)
         
         # Validate repository exists and belongs to this org
         repo = await db.repositories.find_one(
@@ -999,6 +856,7 @@ async def leave_organization_endpoint(current_user: dict = Depends(get_current_u
             {"org_id": org_id},
             {"$pull": {"member_user_ids": user_id}}
         )
+        membership_resolver.invalidate(org_id, user_id)
         
         # Update user's org_id to None
         await db.users.update_one(
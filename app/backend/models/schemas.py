@@ -96,6 +96,8 @@ class Repository(BaseModel):
     is_private: bool = False  
     files_processed: int = 0
     chunks_stored: int = 0
+    last_commit_sha: Optional[str] = None  # commit the index reflects, diffed on re-ingest
+    file_hashes: List[dict] = []  # [{"path", "hash"}] sha256 per indexed file
     ingested_at: datetime = Field(default_factory=datetime.utcnow)
 
 class ChatRequest(BaseModel):
@@ -1,23 +1,46 @@
 import os
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from langchain_groq import ChatGroq
 from langchain_qdrant import QdrantVectorStore, FastEmbedSparse, RetrievalMode
 from langchain_core.prompts import ChatPromptTemplate
 from langchain.schema.runnable import RunnablePassthrough
 from langchain.schema.output_parser import StrOutputParser
+from qdrant_client import QdrantClient
 from qdrant_client.models import Filter, FieldCondition, MatchAny
 from dotenv import load_dotenv
 from core.database import get_database
-from core.embeddings import create_embeddings
+from core.embeddings import create_embeddings, QueryBatchingEmbeddings, PrecomputedQueryEmbeddings, QUERY_EMBED_MAX_BATCH
+from core.answer_cache import answer_cache
+from core.chat_buffer import chat_write_buffer
+from services.collection_manager import get_active_collection
+from services.collection_profiles import get_search_params
 
 load_dotenv()
 QDRANT_URL = os.getenv("QDRANT_URL")
 QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 
+# Qdrant retrieval through langchain has no async client, so it runs on a bounded pool
+# instead of the event loop; the LLM call uses ChatGroq's native async API
+CHAT_RETRIEVAL_WORKERS = int(os.getenv("CHAT_RETRIEVAL_WORKERS", "8"))
+retrieval_executor = ThreadPoolExecutor(max_workers=CHAT_RETRIEVAL_WORKERS, thread_name_prefix="chat-retrieval")
+VECTOR_STORE_CACHE_SIZE = int(os.getenv("VECTOR_STORE_CACHE_SIZE", "64"))
+
 # load models and cache them
 llm_cache = None
 embeddings_cache = None
+sparse_embeddings_cache = None
+qdrant_client_cache = None
+
+# physical collection name -> QdrantVectorStore, least recently used first
+vector_store_cache = OrderedDict()
+# alias -> physical collection it was last served from, to drop handles replaced by a re-index
+vector_store_aliases = {}
+vector_store_lock = threading.Lock()
 
 def get_llm():
     global llm_cache
@@ -35,18 +58,35 @@ def get_embeddings():
     global embeddings_cache
     if embeddings_cache is None:
         print("loading embeddings model")
-        embeddings_cache = create_embeddings()
+        embeddings = create_embeddings()
+        # concurrent chats share forward passes; QUERY_EMBED_MAX_BATCH=1 turns batching off
+        embeddings_cache = QueryBatchingEmbeddings(embeddings) if QUERY_EMBED_MAX_BATCH > 1 else embeddings
         print("embeddings cached")
     return embeddings_cache
 
+def get_sparse_embeddings():
+    global sparse_embeddings_cache
+    if sparse_embeddings_cache is None:
+        print("loading sparse embeddings model")
+        sparse_embeddings_cache = FastEmbedSparse(model_name="Qdrant/bm25")
+        print("sparse embeddings cached")
+    return sparse_embeddings_cache
+
+def get_qdrant_client():
+    """Process-wide Qdrant client; its HTTP connection pool is shared by all chats"""
+    global qdrant_client_cache
+    if qdrant_client_cache is None:
+        qdrant_client_cache = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY)
+    return qdrant_client_cache
+
 def is_broad_question(query: str) -> bool:
     """if user req needs overview context"""
     broad_keywords = ['about', 'purpose', 'overview', 'what is', 'description', 
                       'project', 'repository', 'repo', 'summary']
     return any(keyword in query.lower() for keyword in broad_keywords)
 
-def get_prioritized_docs(vector_store, user_query: str, k: int = 6):
-    """retrieval uses hybrid mode"""
+def get_prioritized_docs(vector_store, user_query: str, k: int = 6, search_params=None):
+    """retrieval uses hybrid mode; search_params carries the collection profile's ef/rescoring"""
     is_broad = is_broad_question(user_query)
     
     if is_broad:
@@ -55,6 +95,7 @@ def get_prioritized_docs(vector_store, user_query: str, k: int = 6):
             readme_docs = vector_store.similarity_search(
                 query="README project description overview purpose",
                 k=5,
+                search_params=search_params,
                 filter=Filter(
                     should=[
                         FieldCondition(
@@ -79,7 +120,68 @@ def get_prioritized_docs(vector_store, user_query: str, k: int = 6):
     
     # standard hybrid search for specific questions
     print("Using standard similarity search")
-    return vector_store.similarity_search(user_query, k=k)
+    return vector_store.similarity_search(user_query, k=k, search_params=search_params)
+
+def get_vector_store(alias: str, collection_name: str):
+    """
+    Cached vector store handle for a physical collection.
+    A re-index switches the alias to a new collection, so the handle for the old one is dropped.
+    """
+    with vector_store_lock:
+        vector_store = vector_store_cache.get(collection_name)
+        if vector_store is not None:
+            vector_store_cache.move_to_end(collection_name)
+            return vector_store
+
+    # validates the collection config against Qdrant once per collection, outside the lock
+    vector_store = QdrantVectorStore(
+        client=get_qdrant_client(),
+        collection_name=collection_name,
+        embedding=get_embeddings(),
+        sparse_embedding=get_sparse_embeddings(),
+        retrieval_mode=RetrievalMode.HYBRID
+    )
+
+    with vector_store_lock:
+        previous = vector_store_aliases.get(alias)
+        if previous and previous != collection_name:
+            vector_store_cache.pop(previous, None)
+        vector_store_aliases[alias] = collection_name
+        vector_store_cache[collection_name] = vector_store
+        while len(vector_store_cache) > VECTOR_STORE_CACHE_SIZE:
+            evicted, _ = vector_store_cache.popitem(last=False)
+            for cached_alias in [a for a, name in vector_store_aliases.items() if name == evicted]:
+                del vector_store_aliases[cached_alias]
+    return vector_store
+
+def with_query_vector(vector_store, user_query: str, query_vector):
+    """
+    Request-scoped copy of a cached vector store that reuses an already computed query vector.
+    The collection config was validated when the cached store was built, so this makes no Qdrant call.
+    """
+    return QdrantVectorStore(
+        client=vector_store.client,
+        collection_name=vector_store.collection_name,
+        embedding=PrecomputedQueryEmbeddings(vector_store.embeddings, user_query, query_vector),
+        sparse_embedding=vector_store.sparse_embeddings,
+        retrieval_mode=RetrievalMode.HYBRID,
+        validate_collection_config=False
+    )
+
+def evict_vector_stores(repo: dict) -> None:
+    """Forget cached handles for a repository (on delete)"""
+    alias = repo["collection_name"]
+    names = {get_active_collection(repo), alias, vector_store_aliases.get(alias)}
+    names.update(entry["name"] for entry in repo.get("retired_collections", []))
+    with vector_store_lock:
+        for name in names:
+            vector_store_cache.pop(name, None)
+        vector_store_aliases.pop(alias, None)
+
+async def run_in_retrieval_pool(func, *args):
+    """Run blocking retrieval work off the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(retrieval_executor, func, *args)
 
 async def get_user_repository(user_id: str, repo_name: str = None):
     """Get user's repository from MongoDB to find collection name.
@@ -87,12 +189,14 @@ async def get_user_repository(user_id: str, repo_name: str = None):
     db = get_database()
     
     if repo_name:
-        repo = await db.repositories.find_one({
-            "name": repo_name
-        })
+        repo = await db.repositories.find_one(
+            {"name": repo_name},
+            {"file_hashes": 0}
+        )
     else:
         repo = await db.repositories.find_one(
             {"user_id": user_id},
+            {"file_hashes": 0},
             sort=[("ingested_at", -1)]
         )
     
@@ -105,8 +209,6 @@ async def save_chat_to_mongodb(user_id: str, user_message: str, ai_response: str
     For personal repos: uses user_id for isolation
     """
     try:
-        db = get_database()
-        
         scope_id = org_id if org_id else user_id
         scope_type = "org_id" if org_id else "user_id"
         
@@ -120,36 +222,26 @@ async def save_chat_to_mongodb(user_id: str, user_message: str, ai_response: str
             "created_at": datetime.utcnow(),
             "updated_at": datetime.utcnow()
         }
-        await db.chats.insert_one(chat_doc)
-        print(f"Chat saved to MongoDB for {scope_type}={scope_id}, repo={repo_name}")
+        # written in batches by the write-behind buffer
+        await chat_write_buffer.add(chat_doc)
+        print(f"Chat queued for MongoDB for {scope_type}={scope_id}, repo={repo_name}")
     except Exception as e:
         print(f"Failed to save chat to MongoDB: {e}")
 
-async def get_chat_response(user_query: str, user_id: str, repository_name: str = None, org_id: str = None):
-    print(f"Chat service: Processing query for user {user_id}, org {org_id}")
-
-    repo = await get_user_repository(user_id, repository_name)
-    
-    if not repo:
-        return "Please ingest a repository first before asking questions."
-    
-    collection_name = repo["collection_name"]
-    print(f"Using collection: {collection_name}")
-
-    # Use cached models
-    llm = get_llm()
-    embeddings = get_embeddings()
-    sparse_embeddings = FastEmbedSparse(model_name="Qdrant/bm25")
+async def retrieve_context(repo: dict, user_query: str, query_vector=None):
+    """
+    Hybrid retrieval against the repository's serving collection.
+    query_vector: dense vector of user_query if the caller already has it
+    """
+    # pin this request to the version the alias served when it started; a re-index
+    # builds into a shadow collection and the old one outlives in-flight chats
+    collection_name = get_active_collection(repo)
+    print(f"Using collection: {collection_name} (alias {repo['collection_name']})")
 
     try:
-        vector_store = QdrantVectorStore.from_existing_collection(
-            embedding=embeddings,
-            sparse_embedding=sparse_embeddings,
-            collection_name=collection_name, 
-            url=QDRANT_URL,
-            api_key=QDRANT_API_KEY,
-            retrieval_mode=RetrievalMode.HYBRID
-        )
+        vector_store = await run_in_retrieval_pool(get_vector_store, repo["collection_name"], collection_name)
+        if query_vector is not None:
+            vector_store = with_query_vector(vector_store, user_query, query_vector)
         print(f"Successfully connected to vector store: {collection_name}")
     except Exception as e:
         print(f"detailed error: {e}")
@@ -157,14 +249,16 @@ async def get_chat_response(user_query: str, user_id: str, repository_name: str
 
     # get documents with smart prioritization
     print(f"Retrieving context for: '{user_query}'")
-    relevant_docs = get_prioritized_docs(vector_store, user_query, k=5)
+    relevant_docs = await run_in_retrieval_pool(get_prioritized_docs, vector_store, user_query, 5, get_search_params(repo))
     print(f"Retrieved {len(relevant_docs)} documents")
     if relevant_docs:
         for i, doc in enumerate(relevant_docs[:5]): 
             filename = doc.metadata.get('filename', doc.metadata.get('source', 'unknown'))
             preview = doc.page_content[:100].replace('\n', ' ')
             print(f"  Doc {i+1}: {filename} - {preview}...")
+    return relevant_docs
 
+def build_chat_chain(relevant_docs):
     system_prompt = (
         "You are a helpful code analysis assistant. Answer the user's question based on the provided context.\n"
         "If the context contains relevant information, provide a clear and specific answer.\n"
@@ -188,15 +282,102 @@ async def get_chat_response(user_query: str, user_id: str, repository_name: str
         return "\n\n---\n\n".join(formatted)
     
     # build chain with pre-retrieved docs
-    chain = (
+    return (
         {"context": lambda x: format_docs(relevant_docs), "input": RunnablePassthrough()}
         | prompt
-        | llm
+        | get_llm()
         | StrOutputParser()
     )
+
+def get_source_metadata(relevant_docs) -> list:
+    """Retrieved chunks -> source references for the client"""
+    return [
+        {
+            "filename": doc.metadata.get("filename", "unknown"),
+            "path": doc.metadata.get("path", doc.metadata.get("source")),
+            # identical chunks are stored once for every file that contains them
+            "paths": doc.metadata.get("paths", [])
+        }
+        for doc in relevant_docs
+    ]
+
+async def embed_query(user_query: str):
+    # awaited on the event loop: concurrent chats are batched without holding retrieval threads
+    return await get_embeddings().aembed_query(user_query)
+
+async def get_chat_response(user_query: str, user_id: str, repository_name: str = None, org_id: str = None):
+    """
+    Returns:
+        {"response": answer, "sources": [...], "cached": True if served from the answer cache}
+    """
+    print(f"Chat service: Processing query for user {user_id}, org {org_id}")
+
+    repo = await get_user_repository(user_id, repository_name)
+    
+    if not repo:
+        return {"response": "Please ingest a repository first before asking questions.", "sources": [], "cached": False}
+
+    query_vector = await embed_query(user_query)
+    cached = answer_cache.lookup(repo, query_vector)
+    if cached:
+        print(f"Answer cache hit (similarity {cached['similarity']:.3f})")
+        await save_chat_to_mongodb(user_id, user_query, cached["response"], repository_name, org_id=org_id)
+        return {"response": cached["response"], "sources": cached["sources"], "cached": True}
+
+    relevant_docs = await retrieve_context(repo, user_query, query_vector)
+    chain = build_chat_chain(relevant_docs)
     
-    response = chain.invoke(user_query)
+    response = await chain.ainvoke(user_query)
+    sources = get_source_metadata(relevant_docs)
+    answer_cache.store(repo, query_vector, response, sources)
     
     await save_chat_to_mongodb(user_id, user_query, response, repository_name, org_id=org_id)
     
-    return response
\ No newline at end of file
+    return {"response": response, "sources": sources, "cached": False}
+
+async def stream_chat_response(user_query: str, user_id: str, repository_name: str = None, org_id: str = None):
+    """
+    Streaming variant of get_chat_response.
+
+    Yields:
+        {"event": "sources", "data": {...}} once retrieval is done, then one
+        {"event": "token", "data": {"content": ...}} per LLM chunk, then
+        {"event": "done", "data": {"response": ..., "cached": ...}} after the exchange is saved
+    """
+    print(f"Chat service: Streaming query for user {user_id}, org {org_id}")
+
+    repo = await get_user_repository(user_id, repository_name)
+
+    if not repo:
+        message = "Please ingest a repository first before asking questions."
+        yield {"event": "token", "data": {"content": message}}
+        yield {"event": "done", "data": {"response": message, "cached": False}}
+        return
+
+    query_vector = await embed_query(user_query)
+    cached = answer_cache.lookup(repo, query_vector)
+    if cached:
+        print(f"Answer cache hit (similarity {cached['similarity']:.3f})")
+        yield {"event": "sources", "data": {"sources": cached["sources"]}}
+        yield {"event": "token", "data": {"content": cached["response"]}}
+        await save_chat_to_mongodb(user_id, user_query, cached["response"], repository_name, org_id=org_id)
+        yield {"event": "done", "data": {"response": cached["response"], "cached": True}}
+        return
+
+    relevant_docs = await retrieve_context(repo, user_query, query_vector)
+    sources = get_source_metadata(relevant_docs)
+    yield {"event": "sources", "data": {"sources": sources}}
+
+    chain = build_chat_chain(relevant_docs)
+    parts = []
+    async for token in chain.astream(user_query):
+        if token:
+            parts.append(token)
+            yield {"event": "token", "data": {"content": token}}
+
+    # only complete answers are persisted; a client disconnect cancels the generator before this
+    response = "".join(parts)
+    answer_cache.store(repo, query_vector, response, sources)
+    await save_chat_to_mongodb(user_id, user_query, response, repository_name, org_id=org_id)
+
+    yield {"event": "done", "data": {"response": response, "cached": False}}
@@ -0,0 +1,105 @@
+"""
+Blue/green Qdrant collections for zero-downtime re-indexing.
+
+The tenant collection name from get_collection_name() is a Qdrant alias. Each full
+(re)index builds into a new versioned collection; once it is complete the alias is
+switched to it atomically, and the previous version is retired and deleted after a
+grace period so in-flight chats can finish against it.
+"""
+
+import os
+from datetime import datetime, timedelta
+from typing import Optional, Dict
+from pymongo.database import Database
+from qdrant_client import QdrantClient
+from qdrant_client.models import CreateAliasOperation, CreateAlias, DeleteAliasOperation, DeleteAlias
+
+COLLECTION_GC_GRACE_SECONDS = int(os.getenv("COLLECTION_GC_GRACE_SECONDS", "600"))
+
+
+def new_collection_version(alias: str) -> str:
+    """Physical collection name for a fresh build behind alias"""
+    return f"{alias}__v{datetime.utcnow().strftime('%Y%m%d%H%M%S%f')}"
+
+
+def get_active_collection(repo: Dict) -> str:
+    """
+    Physical collection currently serving a repository.
+    Repos indexed before aliases existed have a real collection under the alias name.
+    """
+    return repo.get("active_collection") or repo["collection_name"]
+
+
+def switch_collection_alias(client: QdrantClient, alias: str, target: str, previous: Optional[str]) -> None:
+    """
+    Atomically point alias at target.
+
+    Args:
+        previous: collection the alias currently points to, None if the alias was never created
+    """
+    if previous is None and client.collection_exists(alias):
+        # pre-alias layout: the live index is a real collection holding the alias name
+        print(f"Migrating {alias} to an alias (dropping legacy collection)")
+        client.delete_collection(alias)
+
+    create_op = CreateAliasOperation(create_alias=CreateAlias(collection_name=target, alias_name=alias))
+    if previous:
+        try:
+            # delete + create in one request is applied atomically by Qdrant
+            client.update_collection_aliases(change_aliases_operations=[
+                DeleteAliasOperation(delete_alias=DeleteAlias(alias_name=alias)),
+                create_op
+            ])
+            return
+        except Exception as e:
+            print(f"Alias {alias} was missing, recreating it: {e}")
+
+    client.update_collection_aliases(change_aliases_operations=[create_op])
+
+
+def delete_repository_collections(client: QdrantClient, repo: Dict) -> None:
+    """Drop the alias, the serving collection and any retired versions of a repository"""
+    alias = repo["collection_name"]
+    names = [get_active_collection(repo)] + [entry["name"] for entry in repo.get("retired_collections", [])]
+
+    if repo.get("active_collection"):
+        try:
+            client.update_collection_aliases(change_aliases_operations=[
+                DeleteAliasOperation(delete_alias=DeleteAlias(alias_name=alias))
+            ])
+        except Exception as e:
+            print(f"Warning: Failed to delete Qdrant alias {alias}: {e}")
+
+    for name in names:
+        try:
+            client.delete_collection(collection_name=name)
+            print(f"Deleted Qdrant collection: {name}")
+        except Exception as e:
+            print(f"Warning: Failed to delete Qdrant collection {name}: {e}")
+
+
+async def collect_retired_collections(client: QdrantClient, db: Database) -> int:
+    """Delete collections retired longer than the grace period. Returns number deleted."""
+    cutoff = datetime.utcnow() - timedelta(seconds=COLLECTION_GC_GRACE_SECONDS)
+    deleted = 0
+
+    async for repo in db.repositories.find(
+        {"retired_collections.retired_at": {"$lt": cutoff}},
+        {"retired_collections": 1}
+    ):
+        for entry in repo["retired_collections"]:
+            if entry["retired_at"] >= cutoff:
+                continue
+            try:
+                client.delete_collection(collection_name=entry["name"])
+            except Exception as e:
+                print(f"Warning: Failed to delete retired collection {entry['name']}: {e}")
+                continue
+            await db.repositories.update_one(
+                {"_id": repo["_id"]},
+                {"$pull": {"retired_collections": {"name": entry["name"]}}}
+            )
+            deleted += 1
+            print(f"Garbage-collected retired collection: {entry['name']}")
+
+    return deleted
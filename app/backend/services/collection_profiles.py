@@ -0,0 +1,114 @@
+"""
+Qdrant collection performance profiles.
+
+A profile fixes how a repository's dense vectors are stored and searched: quantization
+(int8 scalar or 1-bit binary copies kept in RAM, with rescoring against the originals),
+whether the original vectors live on disk, HNSW graph size (m / ef_construct) and the
+search-time ef. Full (re)indexes pick a profile by plan tier and repository size; the
+name is stored on the repositories document and chat applies its search parameters.
+
+    performance - full precision in RAM (default for paid plans)
+    balanced    - int8 in RAM, originals on disk: ~4x less RAM, rescored top hits
+    compact     - balanced plus a sparser on-disk graph, for large free-tier repos
+    binary      - 1-bit vectors, ~32x less RAM; opt-in only, recall drops at 384 dims
+
+COLLECTION_PROFILE forces one profile for every ingest; COLLECTION_PROFILES_JSON
+overrides or adds profiles, e.g. '{"balanced": {"search_ef": 96}}'.
+"""
+
+import os
+import json
+from typing import Dict, Optional
+from qdrant_client.models import (
+    HnswConfigDiff, ScalarQuantization, ScalarQuantizationConfig, ScalarType,
+    BinaryQuantization, BinaryQuantizationConfig, SearchParams, QuantizationSearchParams
+)
+
+DEFAULT_COLLECTION_PROFILE = "performance"
+COLLECTION_PROFILE = os.getenv("COLLECTION_PROFILE")
+# indexable source bytes above which a repo counts as large for profile selection
+COLLECTION_PROFILE_LARGE_REPO_BYTES = int(os.getenv("COLLECTION_PROFILE_LARGE_REPO_BYTES", str(20 * 1024 ** 2)))
+
+COLLECTION_PROFILES = {
+    "performance": {
+        "quantization": None, "on_disk": False,
+        "hnsw_m": 16, "hnsw_ef_construct": 128, "hnsw_on_disk": False,
+        "search_ef": 128, "oversampling": None
+    },
+    "balanced": {
+        "quantization": "scalar", "on_disk": True,
+        "hnsw_m": 16, "hnsw_ef_construct": 100, "hnsw_on_disk": False,
+        "search_ef": 128, "oversampling": 2.0
+    },
+    "compact": {
+        "quantization": "scalar", "on_disk": True,
+        "hnsw_m": 8, "hnsw_ef_construct": 64, "hnsw_on_disk": True,
+        "search_ef": 64, "oversampling": 3.0
+    },
+    "binary": {
+        "quantization": "binary", "on_disk": True,
+        "hnsw_m": 16, "hnsw_ef_construct": 100, "hnsw_on_disk": False,
+        "search_ef": 128, "oversampling": 3.0
+    },
+}
+
+for name, overrides in json.loads(os.getenv("COLLECTION_PROFILES_JSON", "{}")).items():
+    COLLECTION_PROFILES[name] = {**COLLECTION_PROFILES.get(name, COLLECTION_PROFILES[DEFAULT_COLLECTION_PROFILE]), **overrides}
+
+
+def get_profile(name: Optional[str]) -> Dict:
+    return COLLECTION_PROFILES.get(name or DEFAULT_COLLECTION_PROFILE, COLLECTION_PROFILES[DEFAULT_COLLECTION_PROFILE])
+
+
+def select_collection_profile(plan: str, repo_bytes: int) -> str:
+    """
+    Profile for a full index build.
+
+    Args:
+        plan: "free", "pro" or "team" (org ingests are team)
+        repo_bytes: total size of the indexable files
+    """
+    if COLLECTION_PROFILE in COLLECTION_PROFILES:
+        return COLLECTION_PROFILE
+
+    large = repo_bytes > COLLECTION_PROFILE_LARGE_REPO_BYTES
+    if plan == "free":
+        return "compact" if large else "balanced"
+    return "balanced" if large else "performance"
+
+
+def get_collection_config(name: str) -> Dict:
+    """create_collection settings for a profile: dense on_disk flag, hnsw_config and quantization_config"""
+    profile = get_profile(name)
+
+    quantization_config = None
+    if profile["quantization"] == "scalar":
+        quantization_config = ScalarQuantization(
+            scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=True)
+        )
+    elif profile["quantization"] == "binary":
+        quantization_config = BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=True))
+
+    return {
+        "on_disk": profile["on_disk"],
+        "hnsw_config": HnswConfigDiff(
+            m=profile["hnsw_m"],
+            ef_construct=profile["hnsw_ef_construct"],
+            on_disk=profile["hnsw_on_disk"]
+        ),
+        "quantization_config": quantization_config
+    }
+
+
+def get_search_params(repo: Dict) -> Optional[SearchParams]:
+    """Search parameters for a repository's collection; None (Qdrant defaults) for repos indexed before profiles"""
+    name = repo.get("collection_profile")
+    if not name:
+        return None
+
+    profile = get_profile(name)
+    quantization = None
+    if profile["quantization"]:
+        # search the quantized copies, then re-rank oversampled hits with the original vectors
+        quantization = QuantizationSearchParams(rescore=True, oversampling=profile["oversampling"])
+    return SearchParams(hnsw_ef=profile["search_ef"], quantization=quantization)
@@ -2,21 +2,90 @@ import os
 import shutil
 import git
 import re
-import httpx
+import uuid
+import asyncio
+import time
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
-from typing import Optional
+from typing import Optional, Callable, Awaitable, Iterable, Iterator
+from langchain.schema import Document
 from langchain_community.document_loaders import DirectoryLoader, TextLoader
 from langchain_text_splitters import Language, RecursiveCharacterTextSplitter
-from langchain_qdrant import QdrantVectorStore, FastEmbedSparse, RetrievalMode
+from langchain_qdrant import QdrantVectorStore, FastEmbedSparse
+from qdrant_client import QdrantClient
+from qdrant_client.models import (
+    Filter, FieldCondition, MatchAny, PayloadSchemaType,
+    Distance, VectorParams, SparseVectorParams, SparseIndexParams,
+    PointStruct, SparseVector, OptimizersConfigDiff, CollectionStatus,
+    PointIdsList, SetPayload, SetPayloadOperation
+)
 from dotenv import load_dotenv
 from core.database import get_database
 from core.embeddings import create_embeddings
+from core.embedding_cache import embedding_cache
+from core.http_clients import http_clients
 from services.user_service import get_github_token
+from services.collection_manager import new_collection_version, get_active_collection, switch_collection_alias
+from services.collection_profiles import select_collection_profile, get_collection_config
+from services.entitlement_service import entitlement_checker
+from services.repo_fetcher import fetch_repository
+from services.file_admission import FileAdmission, METADATA_CHECKS
 
 load_dotenv()
 REPO_BASE_PATH = os.path.join(os.path.dirname(__file__), "..", "temp_repos")
 QDRANT_URL = os.getenv("QDRANT_URL")
 QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
+# upload points over gRPC (port 6334) instead of REST
+QDRANT_PREFER_GRPC = os.getenv("QDRANT_PREFER_GRPC", "false").lower() == "true"
+
+SUPPORTED_EXTENSIONS = {".py", ".ts", ".js", ".tsx", ".jsx", ".md", ".java", ".go", ".sh", ".rs", ".c", ".cpp", ".tf", ".yml", ".yaml", ".json", ".txt", ".html", ".css", ".sql"}
+EXCLUDE_DIRS = {"node_modules", ".git", "venv", "__pycache__", "dist", "build", "target", ".next", ".vscode", ".idea"}
+
+EXT_TO_LANG = {
+    ".py": Language.PYTHON,
+    ".js": Language.JS,
+    ".ts": Language.JS, 
+    ".tsx": Language.JS,
+    ".go": Language.GO,
+    ".java": Language.JAVA,
+    ".rs": Language.RUST,
+    ".md": Language.MARKDOWN,
+    ".yaml": "yaml",
+    ".yml": "yaml",  
+    ".tf": "terraform"
+}
+
+# max paths per Qdrant delete filter
+DELETE_BATCH_SIZE = 500
+
+# point ids are uuid5(namespace, sha256 of the chunk text), so identical chunks in a
+# collection collapse into one point whose metadata.paths lists every file containing it
+CHUNK_ID_NAMESPACE = uuid.UUID("5bc53513-7d28-4345-8856-f1a783d02672")
+
+# streaming pipeline: files read per batch, chunks embedded+upserted per batch, and
+# batches buffered between stages (a full queue blocks the stage before it)
+INGEST_FILE_BATCH_SIZE = int(os.getenv("INGEST_FILE_BATCH_SIZE", "32"))
+INGEST_CHUNK_BATCH_SIZE = int(os.getenv("INGEST_CHUNK_BATCH_SIZE", "128"))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "4"))
+
+# upsert requests in flight at once; embedding the next batch overlaps them
+INGEST_UPSERT_PARALLELISM = int(os.getenv("INGEST_UPSERT_PARALLELISM", "4"))
+
+# bulk load: full builds are created with HNSW indexing off and indexed once after the
+# last upsert, instead of Qdrant re-building segments throughout the load
+INGEST_BULK_LOAD = os.getenv("INGEST_BULK_LOAD", "true").lower() == "true"
+INGEST_INDEXING_THRESHOLD_KB = int(os.getenv("INGEST_INDEXING_THRESHOLD_KB", "20000"))
+INGEST_INDEX_WAIT_SECONDS = float(os.getenv("INGEST_INDEX_WAIT_SECONDS", "600"))
+
+# processes used for chunking (0 = split on a thread in this process)
+INGEST_SPLIT_WORKERS = int(os.getenv("INGEST_SPLIT_WORKERS", str(os.cpu_count() or 1)))
+
+# splitters are stateless, so each process builds one per language type and reuses it
+_splitter_cache: dict = {}
+_split_pool: Optional[ProcessPoolExecutor] = None
 
 
 def sanitize_collection_name(name: str) -> str:
@@ -69,32 +138,34 @@ async def check_if_repo_is_private(repo_url: str, github_token: Optional[str] =
         return False
     
     owner, repo = parsed
-    api_url = f"https://api.github.com/repos/{owner}/{repo}"
     
     headers = {"Accept": "application/vnd.github+json"}
     if github_token:
         headers["Authorization"] = f"Bearer {github_token}"
     
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(api_url, headers=headers, timeout=10.0)
-            
-            if response.status_code == 200:
-                data = response.json()
-                is_private = data.get("private", False)
-                print(f"GitHub API check: {owner}/{repo} is {'PRIVATE' if is_private else 'PUBLIC'}")
-                return is_private
-            elif response.status_code == 404:
-                print(f"Repository {owner}/{repo} returned 404 - might be private or inaccessible")
-                return True  
-            else:
-                print(f"GitHub API returned {response.status_code} for {owner}/{repo}")
-                return False
+        response = await http_clients.get("github").get(f"/repos/{owner}/{repo}", headers=headers)
+        
+        if response.status_code == 200:
+            data = response.json()
+            is_private = data.get("private", False)
+            print(f"GitHub API check: {owner}/{repo} is {'PRIVATE' if is_private else 'PUBLIC'}")
+            return is_private
+        elif response.status_code == 404:
+            print(f"Repository {owner}/{repo} returned 404 - might be private or inaccessible")
+            return True  
+        else:
+            print(f"GitHub API returned {response.status_code} for {owner}/{repo}")
+            return False
     except Exception as e:
         print(f"Failed to check repo privacy via API: {e}")
         return False
 
 
+def get_repo_name(repo_url: str) -> str:
+    return repo_url.rstrip('/').split('/')[-1].replace('.git', '')
+
+
 def get_authenticated_repo_url(repo_url: str, github_token: Optional[str] = None) -> str:
     """Convert GitHub URL to authenticated format for private repos"""
     if not github_token:
@@ -111,16 +182,624 @@ def get_authenticated_repo_url(repo_url: str, github_token: Optional[str] = None
     return repo_url
 
 
-async def ingest_repo(repo_url: str, user_id: str, org_id: Optional[str] = None):
+def remove_repo_dir(repo_path: str) -> None:
+    """Delete a cloned repo, clearing read-only git objects on Windows"""
+    shutil.rmtree(repo_path, onerror=lambda func, path, exc: os.chmod(path, 0o777) or func(path))
+
+
+def is_indexable_path(rel_path: str) -> bool:
+    """Check a repo-relative (posix) path against the supported extensions and excluded dirs"""
+    parts = rel_path.split("/")
+    if any(part in EXCLUDE_DIRS for part in parts[:-1]):
+        return False
+    return os.path.splitext(parts[-1])[1].lower() in SUPPORTED_EXTENSIONS
+
+
+def hash_content(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8", errors="ignore")).hexdigest()
+
+
+def iter_indexable_paths(repo_path: str, admission: Optional[FileAdmission] = None) -> Iterator[str]:
+    """
+    Lazily walk the checkout, yielding indexable files as repo-relative posix paths.
+    With an admission filter, ignored directories are pruned and files it rejects are skipped.
+    """
+    for root, dirs, files in os.walk(repo_path):
+        rel_root = os.path.relpath(root, repo_path).replace(os.sep, "/")
+        rel_root = "" if rel_root == "." else rel_root + "/"
+        dirs[:] = [
+            d for d in dirs
+            if d not in EXCLUDE_DIRS and not (admission and admission.is_ignored(rel_root + d, is_dir=True))
+        ]
+        
+        for file in files:
+            rel_path = rel_root + file
+            if is_indexable_path(rel_path) and (admission is None or admission.admit(rel_path)):
+                yield rel_path
+
+
+def estimate_indexable_bytes(git_repo: git.Repo) -> int:
+    """
+    Approximate indexable size of HEAD from the tree's blob sizes, without walking or
+    reading the checkout: supported extensions that pass the admission metadata checks.
+    """
+    total = 0
+    # -z: "<mode> <type> <object> <size>\t<path>" records separated by NUL
+    for record in git_repo.git.ls_tree("-r", "-l", "-z", "HEAD").split("\0"):
+        if not record:
+            continue
+        info, rel_path = record.split("\t", 1)
+        size = info.split()[-1]
+        if not size.isdigit() or not is_indexable_path(rel_path):
+            continue
+        if not any(check(rel_path, int(size), b"") for check in METADATA_CHECKS):
+            total += int(size)
+    return total
+
+
+def load_documents(repo_path: str, rel_paths: list[str]) -> tuple[list[Document], dict[str, str]]:
+    """
+    Read files into Documents.
+    
+    Returns:
+        (documents, file_hashes) where file_hashes maps every readable file
+        (including empty ones) to the sha256 of its content
+    """
+    documents = []
+    file_hashes = {}
+    
+    for rel_path in rel_paths:
+        file_path = os.path.join(repo_path, *rel_path.split("/"))
+        file = os.path.basename(file_path)
+        try:
+            with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
+                content = f.read()
+        except Exception as e:
+            print(f"Skipping file {file}: {str(e)}")
+            continue
+        
+        file_hashes[rel_path] = hash_content(content)
+        if content.strip():
+            documents.append(Document(
+                page_content=content,
+                metadata={"source": file_path, "filename": file, "path": rel_path}
+            ))
+    
+    return documents, file_hashes
+
+
+def build_splitter(lang_type) -> RecursiveCharacterTextSplitter:
+    if isinstance(lang_type, Language):
+        return RecursiveCharacterTextSplitter.from_language(
+            language=lang_type,
+            chunk_size=2000,
+            chunk_overlap=200
+        )
+    
+    elif lang_type == "terraform":
+        return RecursiveCharacterTextSplitter(
+            chunk_size=2000,
+            chunk_overlap=200,
+            separators=["\n\nresource ", "\n\nmodule ", "\n\nvariable ", "\n\noutput ", "\n\n", "\n", " "]
+        )
+
+    elif lang_type == "yaml":
+        return RecursiveCharacterTextSplitter(
+            chunk_size=2000,
+            chunk_overlap=200,
+            separators=["\n---\n", "\n\n", "\n", " "]
+    )
+        
+    return RecursiveCharacterTextSplitter(
+        chunk_size=2000, 
+        chunk_overlap=200
+    )
+
+
+def get_splitter(lang_type) -> RecursiveCharacterTextSplitter:
+    """Cached splitter per EXT_TO_LANG entry (None = generic text)"""
+    splitter = _splitter_cache.get(lang_type)
+    if splitter is None:
+        splitter = build_splitter(lang_type)
+        _splitter_cache[lang_type] = splitter
+    return splitter
+
+
+def split_documents(documents: list[Document]) -> list[Document]:
+    """Language-aware chunking. Top-level so it can run in the split process pool."""
+    all_texts = []
+    for doc in documents:
+        ext = os.path.splitext(doc.metadata.get('source', ''))[1].lower()
+        splitter = get_splitter(EXT_TO_LANG.get(ext))
+        
+        file_chunks = splitter.split_documents([doc])
+        for chunk in file_chunks:
+            chunk.metadata['filename'] = os.path.basename(doc.metadata.get('source', '')) 
+        all_texts.extend(file_chunks)
+    return all_texts
+
+
+def get_split_pool() -> Optional[ProcessPoolExecutor]:
+    """Process pool shared by all ingests in this process, created on first use"""
+    global _split_pool
+    if _split_pool is None and INGEST_SPLIT_WORKERS > 0:
+        # spawn: forking a process that already runs model/IO threads can deadlock the child
+        _split_pool = ProcessPoolExecutor(
+            max_workers=INGEST_SPLIT_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+        print(f"Started chunking pool with {INGEST_SPLIT_WORKERS} processes")
+    return _split_pool
+
+
+def shutdown_split_pool() -> None:
+    global _split_pool
+    if _split_pool is not None:
+        _split_pool.shutdown(cancel_futures=True)
+        _split_pool = None
+
+
+async def split_documents_on_pool(documents: list[Document]) -> list[Document]:
+    """
+    Split on the shared process pool (in a thread without one). A pool whose worker
+    died (OOM kill, segfault) is broken for good, so it is replaced and the batch retried once.
+    """
+    for attempt in range(2):
+        pool = get_split_pool()
+        if pool is None:
+            return await asyncio.to_thread(split_documents, documents)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(pool, split_documents, documents)
+        except BrokenProcessPool:
+            if attempt:
+                raise
+            print("Chunking process pool broke, recreating it")
+            # concurrent splitters all see the same broken pool; only the first replaces it
+            if _split_pool is pool:
+                shutdown_split_pool()
+
+
+def get_changed_paths(git_repo: git.Repo, old_sha: str, new_sha: str) -> Optional[tuple[set[str], set[str]]]:
+    """
+    Diff two commits.
+    
+    Returns:
+        (changed, deleted) repo-relative paths, or None if old_sha is not in
+        the clone (force-push, shallow history) and the caller must compare hashes instead
+    """
+    try:
+        # -z: NUL-separated "status\0path\0" pairs, paths are not C-quoted
+        diff_output = git_repo.git.diff("--name-status", "--no-renames", "-z", old_sha, new_sha)
+    except git.GitCommandError as e:
+        print(f"Could not diff {old_sha[:8]}..{new_sha[:8]}: {e}")
+        return None
+    
+    changed, deleted = set(), set()
+    fields = diff_output.strip("\0").split("\0") if diff_output else []
+    for status, path in zip(fields[::2], fields[1::2]):
+        if status.startswith("D"):
+            deleted.add(path)
+        else:
+            changed.add(path)
+    return changed, deleted
+
+
+def get_chunk_id(content: str) -> str:
+    return str(uuid.uuid5(CHUNK_ID_NAMESPACE, hash_content(content)))
+
+
+def get_point_paths(metadata: dict) -> list[str]:
+    """Files a point belongs to; points written before dedup only carry metadata.path"""
+    return metadata.get("paths") or [metadata.get("path")]
+
+
+def set_point_paths(client: QdrantClient, collection_name: str, point_paths: dict[str, list[str]]) -> None:
+    """Rewrite metadata.paths (and the primary path/filename shown as the source) of existing points"""
+    operations = [
+        SetPayloadOperation(set_payload=SetPayload(
+            payload={"paths": paths, "path": paths[0], "filename": os.path.basename(paths[0])},
+            points=[point_id],
+            key=QdrantVectorStore.METADATA_KEY
+        ))
+        for point_id, paths in point_paths.items()
+    ]
+    for i in range(0, len(operations), DELETE_BATCH_SIZE):
+        client.batch_update_points(collection_name=collection_name, update_operations=operations[i:i + DELETE_BATCH_SIZE])
+
+
+def delete_points_for_paths(client: QdrantClient, collection_name: str, paths: list[str], known_paths: Optional[dict[str, list[str]]] = None) -> None:
+    """
+    Remove the given files from the collection. Points only those files contain are
+    deleted; points shared with other files just drop these paths.
+    
+    Args:
+        known_paths: point id -> paths an in-progress ingest already extended in memory;
+            used instead of the stored payload and updated in place
+    """
+    for i in range(0, len(paths), DELETE_BATCH_SIZE):
+        batch = paths[i:i + DELETE_BATCH_SIZE]
+        removed = set(batch)
+        path_filter = Filter(should=[
+            FieldCondition(key="metadata.path", match=MatchAny(any=batch)),
+            FieldCondition(key="metadata.paths", match=MatchAny(any=batch))
+        ])
+        
+        delete_ids, shared = [], {}
+        offset = None
+        while True:
+            points, offset = client.scroll(
+                collection_name=collection_name,
+                scroll_filter=path_filter,
+                limit=1000,
+                offset=offset,
+                with_payload=[QdrantVectorStore.METADATA_KEY],
+                with_vectors=False
+            )
+            for point in points:
+                point_id = str(point.id)
+                if known_paths is not None and point_id in known_paths:
+                    current = known_paths[point_id]
+                else:
+                    current = get_point_paths(point.payload.get(QdrantVectorStore.METADATA_KEY) or {})
+                remaining = [p for p in current if p not in removed]
+                if remaining:
+                    shared[point_id] = remaining
+                else:
+                    delete_ids.append(point_id)
+                if known_paths is not None and point_id in known_paths:
+                    if remaining:
+                        known_paths[point_id] = remaining
+                    else:
+                        del known_paths[point_id]
+            if offset is None:
+                break
+        
+        if delete_ids:
+            client.delete(collection_name=collection_name, points_selector=PointIdsList(points=delete_ids), wait=True)
+        if shared:
+            set_point_paths(client, collection_name, shared)
+
+
+def create_hybrid_collection(client: QdrantClient, collection_name: str, embeddings, profile: str) -> None:
+    """
+    (Re)create an empty collection laid out the way QdrantVectorStore expects for
+    hybrid retrieval, so batches can be upserted as soon as they are embedded.
+    Storage, quantization and HNSW settings come from the collection profile.
+    """
+    vector_size = len(embeddings.embed_query("dimension probe"))
+    config = get_collection_config(profile)
+    
+    if client.collection_exists(collection_name):
+        client.delete_collection(collection_name)
+    
+    client.create_collection(
+        collection_name=collection_name,
+        vectors_config={
+            QdrantVectorStore.VECTOR_NAME: VectorParams(size=vector_size, distance=Distance.COSINE, on_disk=config["on_disk"])
+        },
+        sparse_vectors_config={
+            QdrantVectorStore.SPARSE_VECTOR_NAME: SparseVectorParams(index=SparseIndexParams(on_disk=config["on_disk"]))
+        },
+        hnsw_config=config["hnsw_config"],
+        quantization_config=config["quantization_config"],
+        # indexing_threshold=0 defers HNSW construction until enable_collection_indexing
+        optimizers_config=OptimizersConfigDiff(indexing_threshold=0) if INGEST_BULK_LOAD else None
+    )
+    for field_name in ("metadata.path", "metadata.paths"):
+        client.create_payload_index(
+            collection_name=collection_name,
+            field_name=field_name,
+            field_schema=PayloadSchemaType.KEYWORD
+        )
+
+
+def enable_collection_indexing(client: QdrantClient, collection_name: str) -> bool:
+    """
+    Turn HNSW indexing back on after a bulk load and wait for the optimizer to finish.
+
+    Returns:
+        True once the collection is green, False if INGEST_INDEX_WAIT_SECONDS ran out
+        (it keeps indexing in the background and is searchable meanwhile)
+    """
+    client.update_collection(
+        collection_name=collection_name,
+        optimizers_config=OptimizersConfigDiff(indexing_threshold=INGEST_INDEXING_THRESHOLD_KB)
+    )
+    deadline = time.monotonic() + INGEST_INDEX_WAIT_SECONDS
+    while time.monotonic() < deadline:
+        status = client.get_collection(collection_name).status
+        if status == CollectionStatus.GREEN:
+            return True
+        if status == CollectionStatus.GREY:
+            # optimizations pending but not started: an empty config update triggers them
+            client.update_collection(collection_name=collection_name, optimizers_config=OptimizersConfigDiff())
+        time.sleep(1)
+    return False
+
+
+def build_points(point_ids: list[str], chunks: list[Document], dense_vectors: list, sparse_vectors: list) -> list[PointStruct]:
+    """Points in the payload/vector layout QdrantVectorStore reads back at chat time"""
+    return [
+        PointStruct(
+            id=point_id,
+            vector={
+                QdrantVectorStore.VECTOR_NAME: dense,
+                QdrantVectorStore.SPARSE_VECTOR_NAME: SparseVector(indices=list(sparse.indices), values=list(sparse.values))
+            },
+            payload={
+                QdrantVectorStore.CONTENT_KEY: chunk.page_content,
+                QdrantVectorStore.METADATA_KEY: {**chunk.metadata, "paths": [chunk.metadata["path"]]}
+            }
+        )
+        for point_id, chunk, dense, sparse in zip(point_ids, chunks, dense_vectors, sparse_vectors)
+    ]
+
+
+async def run_ingest_pipeline(
+    repo_path: str,
+    rel_paths: Iterable[str],
+    client: QdrantClient,
+    collection_name: str,
+    embeddings,
+    sparse_embeddings: FastEmbedSparse,
+    previous_hashes: Optional[dict[str, str]] = None,
+    report_stage: Optional[Callable[[str], Awaitable[None]]] = None
+) -> dict:
+    """
+    Stream files through read -> split -> embed+upsert in fixed-size batches.
+    File batches are split in parallel on the chunking process pool, and chunk
+    vectors come from the embedding cache where possible.
+    
+    Stages are connected by bounded queues, so memory stays proportional to the batch
+    sizes rather than the repo size, and the first vectors are written while the walk
+    is still running.
+    
+    Exact duplicates are stored once: a file identical to one already read in this run
+    is not split, and a chunk whose id (hash of its text) was already written, in this
+    run or earlier for incremental re-ingests, is not embedded again. Either way the
+    extra path is added to the existing point's metadata.paths.
+    
+    Args:
+        rel_paths: files to read; may be a lazy walk
+        previous_hashes: on incremental re-ingest, files whose hash is unchanged are skipped
+            and points of modified files are deleted before their new chunks are queued
+    
+    Returns:
+        {"files_processed", "chunks_embedded", "file_hashes", "embedding_cache", "dedup"} where
+        file_hashes covers every file read, changed or not, embedding_cache holds
+        dense/sparse hit and miss counts and dedup counts duplicate files and chunks
+    """
+    doc_queue: asyncio.Queue = asyncio.Queue(maxsize=INGEST_QUEUE_SIZE)
+    chunk_queue: asyncio.Queue = asyncio.Queue(maxsize=INGEST_QUEUE_SIZE)
+    stats = {
+        "files_processed": 0, "chunks_embedded": 0, "file_hashes": {}, "embedding_cache": {},
+        "dedup": {"files_deduplicated": 0, "chunks_total": 0, "chunks_deduplicated": 0}
+    }
+    # content hash -> first path read with it, and first path -> identical files
+    seen_files: dict[str, str] = {}
+    file_aliases: dict[str, list[str]] = {}
+    # point id -> paths for every point written or extended in this run, file -> its point ids,
+    # and points whose paths grew after they were written
+    point_paths: dict[str, list[str]] = {}
+    path_points: dict[str, list[str]] = {}
+    extended: set = set()
+    # serializes dedup bookkeeping with the deletion of modified files' points
+    paths_lock = asyncio.Lock()
+    reported = set()
+    
+    async def report_once(stage: str):
+        if report_stage and stage not in reported:
+            reported.add(stage)
+            await report_stage(stage)
+    
+    def next_path_batch(path_iter: Iterator[str]) -> list[str]:
+        batch = []
+        for rel_path in path_iter:
+            batch.append(rel_path)
+            if len(batch) >= INGEST_FILE_BATCH_SIZE:
+                break
+        return batch
+    
+    async def read_files():
+        path_iter = iter(rel_paths)
+        while True:
+            batch = await asyncio.to_thread(next_path_batch, path_iter)
+            if not batch:
+                break
+            
+            documents, hashes = await asyncio.to_thread(load_documents, repo_path, batch)
+            stats["file_hashes"].update(hashes)
+            
+            if previous_hashes is not None:
+                changed = {p for p, h in hashes.items() if previous_hashes.get(p) != h}
+                documents = [doc for doc in documents if doc.metadata["path"] in changed]
+                modified = sorted(p for p in changed if p in previous_hashes)
+                if modified:
+                    async with paths_lock:
+                        await asyncio.to_thread(delete_points_for_paths, client, collection_name, modified, point_paths)
+            
+            stats["files_processed"] += len(documents)
+            unique_documents = []
+            for doc in documents:
+                path = doc.metadata["path"]
+                first = seen_files.setdefault(hashes[path], path)
+                if first == path:
+                    unique_documents.append(doc)
+                else:
+                    file_aliases.setdefault(first, []).append(path)
+                    stats["dedup"]["files_deduplicated"] += 1
+            
+            if unique_documents:
+                await doc_queue.put(unique_documents)
+        await doc_queue.put(None)
+    
+    async def split_files():
+        while True:
+            documents = await doc_queue.get()
+            if documents is None:
+                # let the sibling splitters see the end of stream too
+                await doc_queue.put(None)
+                break
+            
+            await report_once("chunking")
+            chunks = await split_documents_on_pool(documents)
+            await chunk_queue.put(chunks)
+    
+    async def split_all_files():
+        # one splitter per pool process keeps every core busy with a file batch
+        await asyncio.gather(*[split_files() for _ in range(max(INGEST_SPLIT_WORKERS, 1))])
+        await chunk_queue.put(None)
+    
+    def add_point_path(point_id: str, path: str):
+        paths = point_paths[point_id]
+        if path not in paths:
+            paths.append(path)
+            extended.add(point_id)
+    
+    def raise_upload_error():
+        if upload_errors:
+            raise upload_errors[0]
+    
+    def upload_done(task: asyncio.Task):
+        uploads.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            upload_errors.append(task.exception())
+    
+    async def upsert_batch(chunks: list[Document]):
+        # stop embedding as soon as a background upload has failed
+        raise_upload_error()
+        await report_once("embedding")
+        stats["dedup"]["chunks_total"] += len(chunks)
+        
+        async with paths_lock:
+            new_points = {}
+            for chunk in chunks:
+                point_id = get_chunk_id(chunk.page_content)
+                path = chunk.metadata["path"]
+                path_points.setdefault(path, []).append(point_id)
+                if point_id in point_paths:
+                    add_point_path(point_id, path)
+                    stats["dedup"]["chunks_deduplicated"] += 1
+                else:
+                    point_paths[point_id] = [path]
+                    new_points[point_id] = chunk
+        
+            if previous_hashes is not None and new_points:
+                # incremental: the collection may already hold these chunks for unchanged files
+                existing = await asyncio.to_thread(
+                    client.retrieve, collection_name=collection_name, ids=list(new_points),
+                    with_payload=[QdrantVectorStore.METADATA_KEY], with_vectors=False
+                )
+                for point in existing:
+                    point_id = str(point.id)
+                    path = point_paths[point_id][0]
+                    point_paths[point_id] = get_point_paths(point.payload.get(QdrantVectorStore.METADATA_KEY) or {})
+                    add_point_path(point_id, path)
+                    new_points.pop(point_id, None)
+                    stats["dedup"]["chunks_deduplicated"] += 1
+        
+        if not new_points:
+            return
+        chunks = list(new_points.values())
+        texts = [chunk.page_content for chunk in chunks]
+        dense_vectors = await embedding_cache.embed_dense(embeddings, texts, stats["embedding_cache"])
+        sparse_vectors = await embedding_cache.embed_sparse(sparse_embeddings, texts, stats["embedding_cache"])
+        
+        points = build_points(list(new_points), chunks, dense_vectors, sparse_vectors)
+        await report_once("upserting")
+        await upload_slots.acquire()
+        if upload_errors:
+            upload_slots.release()
+            raise_upload_error()
+        upload = asyncio.create_task(upload_points(points))
+        uploads.add(upload)
+        upload.add_done_callback(upload_done)
+    
+    async def upload_points(points: list[PointStruct]):
+        try:
+            await asyncio.to_thread(client.upsert, collection_name=collection_name, points=points)
+            stats["chunks_embedded"] += len(points)
+        finally:
+            upload_slots.release()
+    
+    async def embed_and_upsert():
+        pending = []
+        while True:
+            chunks = await chunk_queue.get()
+            if chunks is None:
+                break
+            
+            pending.extend(chunks)
+            while len(pending) >= INGEST_CHUNK_BATCH_SIZE:
+                await upsert_batch(pending[:INGEST_CHUNK_BATCH_SIZE])
+                pending = pending[INGEST_CHUNK_BATCH_SIZE:]
+        
+        if pending:
+            await upsert_batch(pending)
+        # finished uploads have already left the set, their failures are in upload_errors
+        await asyncio.gather(*list(uploads), return_exceptions=True)
+        raise_upload_error()
+    
+    # up to INGEST_UPSERT_PARALLELISM uploads run concurrently with embedding
+    upload_slots = asyncio.Semaphore(max(INGEST_UPSERT_PARALLELISM, 1))
+    uploads: set = set()
+    upload_errors: list[BaseException] = []
+    
+    tasks = [
+        asyncio.create_task(read_files()),
+        asyncio.create_task(split_all_files()),
+        asyncio.create_task(embed_and_upsert())
+    ]
+    try:
+        await asyncio.gather(*tasks)
+    except Exception:
+        for task in tasks + list(uploads):
+            task.cancel()
+        raise
+    
+    # duplicate files share every point of the first copy
+    for first, aliases in file_aliases.items():
+        first_points = path_points.get(first, [])
+        for alias in aliases:
+            stats["dedup"]["chunks_total"] += len(first_points)
+            stats["dedup"]["chunks_deduplicated"] += len(first_points)
+            for point_id in first_points:
+                add_point_path(point_id, alias)
+    # points deleted along with a modified file are no longer in point_paths
+    extended_paths = {point_id: point_paths[point_id] for point_id in extended if point_id in point_paths}
+    if extended_paths:
+        await asyncio.to_thread(set_point_paths, client, collection_name, extended_paths)
+    
+    dedup = stats["dedup"]
+    dedup["ratio"] = round(dedup["chunks_deduplicated"] / dedup["chunks_total"], 4) if dedup["chunks_total"] else 0.0
+    return stats
+
+
+async def ingest_repo(
+    repo_url: str,
+    user_id: str,
+    org_id: Optional[str] = None,
+    on_stage: Optional[Callable[[str], Awaitable[None]]] = None
+):
     """
     Ingest repository to Qdrant.
     
+    First ingest indexes every file. Re-ingests diff against the commit stored on
+    the repositories document and only re-embed added/modified files; points for
+    removed files are deleted.
+    
     Args:
         repo_url: GitHub repository URL
         user_id: Clerk user_id performing the ingest
         org_id: Organization ID (ingesting to team workspace)
+        on_stage: Optional async callback invoked with each stage name
+            (cloning, parsing, chunking, embedding, upserting, indexing) for job progress
     """
     
+    async def report_stage(stage: str):
+        if on_stage:
+            await on_stage(stage)
+    
     if org_id:
         owner_type = "org"
         owner_id = org_id
@@ -140,7 +819,7 @@ async def ingest_repo(repo_url: str, user_id: str, org_id: Optional[str] = None)
     
     is_private = await check_if_repo_is_private(repo_url, github_token)
     
-    repo_name = repo_url.rstrip('/').split('/')[-1].replace('.git', '')
+    repo_name = get_repo_name(repo_url)
     collection_name = get_collection_name(owner_type, owner_id, repo_name)
     
     repo_path = os.path.join(REPO_BASE_PATH, f"{owner_type}_{owner_id}_{repo_name}")
@@ -149,11 +828,12 @@ async def ingest_repo(repo_url: str, user_id: str, org_id: Optional[str] = None)
 
     if os.path.exists(repo_path):
         try:
-            shutil.rmtree(repo_path, onerror=lambda func, path, exc: os.chmod(path, 0o777) or func(path))
+            await asyncio.to_thread(remove_repo_dir, repo_path)
         except Exception as e:
             return {"status": "error", "message": f"Failed to remove existing repo: {str(e)}"}
 
     print(f"Cloning repo to {repo_path}")
+    await report_stage("cloning")
     try:
         authenticated_url = get_authenticated_repo_url(repo_url, github_token)
         
@@ -167,8 +847,11 @@ async def ingest_repo(repo_url: str, user_id: str, org_id: Optional[str] = None)
         else:
             print(f"Cloning PUBLIC repository")
         
-        git.Repo.clone_from(authenticated_url, repo_path)
-        print(f" Successfully cloned {'private' if is_private else 'public'} repository")
+        # mirror fetch, checkout and cache eviction are blocking git/disk work; keep the
+        # event loop (and the worker's lease heartbeat) running meanwhile
+        git_repo = await asyncio.to_thread(fetch_repository, repo_url, authenticated_url, repo_path)
+        head_sha = git_repo.head.commit.hexsha
+        print(f" Successfully cloned {'private' if is_private else 'public'} repository at {head_sha[:8]}")
         
     except git.GitCommandError as e:
         error_msg = str(e)
@@ -187,155 +870,214 @@ async def ingest_repo(repo_url: str, user_id: str, org_id: Optional[str] = None)
     except Exception as e:
         return {"status": "error", "message": f"Failed to clone: {str(e)}"}
     
-    # load code files
-    print("parsing code files")
+    db = get_database()
+    existing_repo = await db.repositories.find_one({"collection_name": collection_name})
+    
+    previous_sha = existing_repo.get("last_commit_sha") if existing_repo else None
+    previous_hashes = {
+        entry["path"]: entry["hash"] for entry in existing_repo.get("file_hashes", [])
+    } if existing_repo and existing_repo.get("file_hashes") is not None else None
+    
     try:
-        documents = []
-        supported_extensions = {".py", ".ts", ".js", ".tsx", ".jsx", ".md", ".java", ".go", ".sh", ".rs", ".c", ".cpp", ".tf", ".yml", ".yaml", ".json", ".txt", ".html", ".css", ".sql"}
-        exclude_dirs = {"node_modules", ".git", "venv", "__pycache__", "dist", "build", "target", ".next", ".vscode", ".idea"}
+        qdrant_client = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY, prefer_grpc=QDRANT_PREFER_GRPC)
+        live_collection = get_active_collection(existing_repo) if existing_repo else None
+        # points written before per-file hashes existed carry no metadata.path, so those need a full rebuild
+        incremental = bool(
+            previous_sha and previous_hashes is not None and live_collection
+            and await asyncio.to_thread(qdrant_client.collection_exists, live_collection)
+        )
+    except Exception as e:
+        return {"status": "error", "message": f"Failed to connect to Qdrant: {str(e)}"}
+    
+    # incremental updates patch the live collection in place (per-file point swaps);
+    # full builds go into a shadow collection that chats can't see until the alias switch
+    target_collection = live_collection if incremental else new_collection_version(collection_name)
+    
+    # resolve which files to read; junk is rejected here, before any file is read
+    admission = FileAdmission(repo_path)
+    try:
+        diff = None
         
-        for root, dirs, files in os.walk(repo_path):
-            dirs[:] = [d for d in dirs if d not in exclude_dirs]
-            
-            for file in files:
-                file_path = os.path.join(root, file)
-                ext = os.path.splitext(file)[1].lower()
-                
-                # process supported extensions
-                if ext in supported_extensions:
-                    try:
-                        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                            content = f.read()
-                            if content.strip():  
-                                from langchain.schema import Document
-                                doc = Document(
-                                    page_content=content,
-                                    metadata={"source": file_path, "filename": file}
-                                )
-                                documents.append(doc)
-                    except Exception as e:
-                        print(f"Skipping file {file}: {str(e)}")
-                        continue
+        if incremental:
+            print(f"Incremental re-index: {previous_sha[:8]} -> {head_sha[:8]}")
+            diff = await asyncio.to_thread(get_changed_paths, git_repo, previous_sha, head_sha)
         
-        print(f"loaded {len(documents)} files")
+        if diff is not None:
+            changed, deleted = diff
+            candidate_paths = sorted(
+                p for p in changed
+                if is_indexable_path(p) and os.path.isfile(os.path.join(repo_path, *p.split("/"))) and admission.admit(p)
+            )
+            print(f"Admitted {len(candidate_paths)} changed files, skipped {admission.get_stats()}")
+        else:
+            # first ingest, or previous commit unreachable: walk the whole tree lazily inside the
+            # pipeline (hashes decide what changed)
+            candidate_paths = iter_indexable_paths(repo_path, admission)
     except Exception as e:
         return {"status": "error", "message": f"Failed to parse documents: {str(e)}"}
+    
+    if incremental:
+        # patched in place, so the collection keeps the profile it was built with
+        collection_profile = existing_repo.get("collection_profile")
+    else:
+        if org_id:
+            plan = "team"
+        else:
+            plan_name, _, is_active = await entitlement_checker.get_user_plan(user_id)
+            plan = plan_name if is_active else "free"
+        try:
+            repo_bytes = await asyncio.to_thread(estimate_indexable_bytes, git_repo)
+        except git.GitCommandError as e:
+            print(f"Could not size {head_sha[:8]}, assuming a small repo: {e}")
+            repo_bytes = 0
+        collection_profile = select_collection_profile(plan, repo_bytes)
+        print(f"Collection profile: {collection_profile} (plan {plan}, ~{repo_bytes} indexable bytes)")
 
-    # chunking
-    print("splitting code into chunks")
-    
-    EXT_TO_LANG = {
-        ".py": Language.PYTHON,
-        ".js": Language.JS,
-        ".ts": Language.JS, 
-        ".tsx": Language.JS,
-        ".go": Language.GO,
-        ".java": Language.JAVA,
-        ".rs": Language.RUST,
-        ".md": Language.MARKDOWN,
-        ".yaml": "yaml",
-        ".yml": "yaml",  
-        ".tf": "terraform"
-    }
+    # stream files through chunking, embedding and upserting
+    print("parsing, chunking and embedding code files")
+    await report_stage("parsing")
 
-    all_texts = []
-    for doc in documents:
-        ext = os.path.splitext(doc.metadata.get('source', ''))[1].lower()
-        lang_type = EXT_TO_LANG.get(ext)
+    try:
+        # model loads, Qdrant calls and forward passes below block; they run in threads so the
+        # worker's lease heartbeat keeps running
+        embeddings = await asyncio.to_thread(create_embeddings)
 
-        if isinstance(lang_type, Language):
-            splitter = RecursiveCharacterTextSplitter.from_language(
-                language=lang_type,
-                chunk_size=2000,
-                chunk_overlap=200
-            )
+        sparse_embeddings = await asyncio.to_thread(FastEmbedSparse, model_name="Qdrant/bm25")
         
-        elif lang_type == "terraform":
-            splitter = RecursiveCharacterTextSplitter(
-                chunk_size=2000,
-                chunk_overlap=200,
-                separators=["\n\nresource ", "\n\nmodule ", "\n\nvariable ", "\n\noutput ", "\n\n", "\n", " "]
-            )
-
-        elif lang_type == "yaml":
-            splitter = RecursiveCharacterTextSplitter(
-                chunk_size=2000,
-                chunk_overlap=200,
-                separators=["\n---\n", "\n\n", "\n", " "]
+        load_started = time.perf_counter()
+        if not incremental:
+            await asyncio.to_thread(create_hybrid_collection, qdrant_client, target_collection, embeddings, collection_profile)
+        
+        stats = await run_ingest_pipeline(
+            repo_path,
+            candidate_paths,
+            qdrant_client,
+            target_collection,
+            embeddings,
+            sparse_embeddings,
+            previous_hashes=previous_hashes if incremental else None,
+            report_stage=report_stage
         )
+        load_seconds = time.perf_counter() - load_started
+        read_hashes = stats["file_hashes"]
+        if diff is None:
+            print(f"Admitted {len(read_hashes)} files, skipped {admission.get_stats()}")
+        
+        deleted_paths = set()
+        if incremental:
+            if diff is not None:
+                # deleted files, plus changed files that are no longer readable
+                deleted_paths = {p for p in deleted if p in previous_hashes}
+                deleted_paths |= {p for p in candidate_paths if p in previous_hashes and p not in read_hashes}
+                # changed files the admission filter now rejects (e.g. grew past the size cap)
+                deleted_paths |= {p for p in admission.skipped_paths if p in previous_hashes}
+            else:
+                deleted_paths = set(previous_hashes) - set(read_hashes)
             
+            if deleted_paths:
+                await asyncio.to_thread(delete_points_for_paths, qdrant_client, target_collection, sorted(deleted_paths))
+                print(f"Deleted points for {len(deleted_paths)} removed files")
+            
+            file_hashes = {p: h for p, h in previous_hashes.items() if p not in deleted_paths}
+            file_hashes.update(read_hashes)
         else:
-            splitter = RecursiveCharacterTextSplitter(
-                chunk_size=2000, 
-                chunk_overlap=200
-            )
+            file_hashes = read_hashes
         
-        file_chunks = splitter.split_documents([doc])
-        for chunk in file_chunks:
-            chunk.metadata['filename'] = os.path.basename(doc.metadata.get('source', '')) 
-        all_texts.extend(file_chunks)
-
-    # embed and store
-    print(f"creating embeddings")
-
-    try:
-        embeddings = create_embeddings()
-
-        sparse_embeddings = FastEmbedSparse(model_name="Qdrant/bm25")
-        print(f"saving to qdrant")
-
-        QdrantVectorStore.from_documents(
-            all_texts,
-            embeddings,
-            sparse_embedding=sparse_embeddings,
-            url=QDRANT_URL,
-            api_key=QDRANT_API_KEY,
-            collection_name=collection_name,  
-            retrieval_mode=RetrievalMode.HYBRID,
-            force_recreate=True  
-        )
-        print(f"Successfully saved to Qdrant collection: {collection_name}")
+        chunks_stored = (await asyncio.to_thread(qdrant_client.count, collection_name=target_collection, exact=True)).count
+        
+        index_seconds = None
+        if not incremental and INGEST_BULK_LOAD:
+            # build the HNSW index once over the full load, before the alias makes it live
+            await report_stage("indexing")
+            index_started = time.perf_counter()
+            if not await asyncio.to_thread(enable_collection_indexing, qdrant_client, target_collection):
+                print(f"Warning: {target_collection} still indexing after {INGEST_INDEX_WAIT_SECONDS}s, switching anyway")
+            index_seconds = time.perf_counter() - index_started
+            print(f"Loaded in {load_seconds:.1f}s, indexed in {index_seconds:.1f}s")
+        
+        if not incremental:
+            await asyncio.to_thread(
+                switch_collection_alias, qdrant_client, collection_name, target_collection,
+                existing_repo.get("active_collection") if existing_repo else None
+            )
+            print(f"Alias {collection_name} now serves {target_collection}")
+        print(f"Successfully saved to Qdrant collection: {target_collection}")
     
     except Exception as e:
         print(f"Qdrant error details: {str(e)}")
+        if not incremental:
+            # the live collection was never touched; drop the half-built shadow
+            try:
+                await asyncio.to_thread(qdrant_client.delete_collection, target_collection)
+            except Exception as cleanup_error:
+                print(f"Warning: Failed to drop shadow collection {target_collection}: {cleanup_error}")
         return {"status": "error", "message": f"Failed to save to Qdrant: {str(e)}"}
 
+    try:
+        await embedding_cache.enforce_limit()
+    except Exception as e:
+        print(f"Warning: Failed to trim embedding cache: {e}")
+
     # save repo metadata to mongoDB
     try:
-        db = get_database()
         repo_doc = {
             "user_id": user_id if not org_id else None, 
             "org_id": org_id,  
             "github_url": repo_url,
             "name": repo_name,
             "collection_name": collection_name,
+            "active_collection": target_collection,
+            "collection_profile": collection_profile,
             "is_private": is_private,
-            "files_processed": len(documents),
-            "chunks_stored": len(all_texts),
+            "files_processed": len(file_hashes),
+            "chunks_stored": chunks_stored,
+            "last_commit_sha": head_sha,
+            "file_hashes": [{"path": path, "hash": h} for path, h in sorted(file_hashes.items())],
             "ingested_at": datetime.utcnow()
         }
-        await db.repositories.insert_one(repo_doc)
+        update = {"$set": repo_doc}
+        if existing_repo and existing_repo.get("active_collection") and existing_repo["active_collection"] != target_collection:
+            # deleted by collect_retired_collections once in-flight chats are done with it
+            update["$push"] = {"retired_collections": {"name": existing_repo["active_collection"], "retired_at": datetime.utcnow()}}
+        
+        await db.repositories.update_one(
+            {"collection_name": collection_name},
+            update,
+            upsert=True
+        )
         print(f" Repository metadata saved to MongoDB")
     except Exception as e:
         print(f"Failed to save to MongoDB: {e}")
     
     print(f"cloned repository data at local cleaned")
     try:
-        shutil.rmtree(repo_path, onerror=lambda func, path, exc: os.chmod(path, 0o777) or func(path))
+        await asyncio.to_thread(remove_repo_dir, repo_path)
         print(f"Deleted temporary repository files")
     except Exception as e:
         print(f"Warning: Failed to delete temp repo: {e}")
 
     result = {
         "status": "success",
-        "files_processed": len(documents),
-        "chunks_stored": len(all_texts),
+        "mode": "incremental" if incremental else "full",
+        "commit_sha": head_sha,
+        "files_processed": stats["files_processed"],
+        "files_deleted": len(deleted_paths),
+        "files_skipped": admission.get_stats(),
+        "chunks_stored": chunks_stored,
+        "chunks_embedded": stats["chunks_embedded"],
+        "embedding_cache": stats["embedding_cache"],
+        "dedup": stats["dedup"],
+        "dedup_ratio": stats["dedup"]["ratio"],
+        "load_seconds": round(load_seconds, 2),
+        "index_seconds": round(index_seconds, 2) if index_seconds is not None else None,
         "collection_name": collection_name,
+        "active_collection": target_collection,
+        "collection_profile": collection_profile,
         "is_private": is_private,
         "message": f"{'Private' if is_private else 'Public'} repository indexed successfully"
     }
     print(f"Ingestion completed successfully")
     print(f"Repository: {repo_name} ({'PRIVATE' if is_private else 'PUBLIC'})")
     print(f"Tenant: {owner_type}({owner_id}) -> Collection: {collection_name}")
-    print(f"Files: {len(documents)}, Chunks: {len(all_texts)}")
-    return result
\ No newline at end of file
+    print(f"Files: {stats['files_processed']}, Chunks embedded: {stats['chunks_embedded']}, Chunks stored: {chunks_stored}")
+    return result
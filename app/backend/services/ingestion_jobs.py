@@ -0,0 +1,233 @@
+"""
+Mongo-backed ingestion job queue.
+API replicas enqueue jobs and return immediately; worker processes (worker.py)
+claim jobs with a lease, run ingest_repo and report each stage back on the job.
+
+Queued and running jobs carry active=True; a unique partial index on
+(collection_name) where active is true (database_setup.py) keeps at most one
+active job per collection. A worker renews its lease while it runs a job, and only
+the worker holding the lease may record stages or finish the job.
+"""
+
+import os
+from datetime import datetime, timedelta
+from typing import Optional, Dict
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.database import Database
+from pymongo.errors import DuplicateKeyError
+from services.org_service import release_org_quota
+
+# how long a claimed job may go without a lease renewal before another worker may take it over
+JOB_LEASE_SECONDS = int(os.getenv("INGEST_JOB_LEASE_SECONDS", "1800"))
+# how often a worker renews the lease of the job it is running
+JOB_HEARTBEAT_SECONDS = float(os.getenv("INGEST_JOB_HEARTBEAT_SECONDS", str(max(JOB_LEASE_SECONDS // 3, 1))))
+JOB_MAX_ATTEMPTS = int(os.getenv("INGEST_JOB_MAX_ATTEMPTS", "2"))
+
+JOB_STAGES = ["queued", "cloning", "parsing", "chunking", "embedding", "upserting", "indexing", "completed", "failed"]
+
+
+async def enqueue_ingestion_job(repo_url: str, user_id: str, org_id: Optional[str], collection_name: str, db: Database,
+                                quota_month: Optional[str] = None) -> Dict:
+    """
+    Queue a repository for ingestion.
+    If the same collection already has a queued/running job, that job is returned instead
+    (marked "deduplicated", so the caller can give back the quota slot it reserved).
+    quota_month is the org quota slot reserved for this ingest, released if the job fails.
+
+    Returns:
+        job document
+    """
+    # the unique active index decides between concurrent requests; retry once if the
+    # conflicting job finished before it could be read back
+    for _ in range(2):
+        now = datetime.utcnow()
+        job = {
+            "repo_url": repo_url,
+            "user_id": user_id,
+            "org_id": org_id,
+            "collection_name": collection_name,
+            "quota_month": quota_month,
+            "status": "queued",
+            "stage": "queued",
+            "active": True,
+            "stages": [{"name": "queued", "started_at": now}],
+            "attempts": 0,
+            "worker_id": None,
+            "lease_expires_at": None,
+            "result": None,
+            "error": None,
+            "created_at": now,
+            "updated_at": now
+        }
+        try:
+            inserted = await db.ingestion_jobs.insert_one(job)
+        except DuplicateKeyError:
+            active_job = await db.ingestion_jobs.find_one({"collection_name": collection_name, "active": True})
+            if active_job:
+                active_job["deduplicated"] = True
+                return active_job
+            continue
+        job["_id"] = inserted.inserted_id
+        return job
+
+    raise RuntimeError(f"Could not enqueue an ingestion job for {collection_name}")
+
+
+async def claim_next_job(worker_id: str, db: Database) -> Optional[Dict]:
+    """
+    Atomically claim the oldest queued job, or a running job whose worker stopped renewing its lease.
+
+    Returns:
+        claimed job document, or None if the queue is empty
+    """
+    now = datetime.utcnow()
+
+    # jobs that keep losing their worker are given up on; one at a time so each one's
+    # quota slot is released exactly once
+    while True:
+        abandoned = await db.ingestion_jobs.find_one_and_update(
+            {"status": "running", "lease_expires_at": {"$lt": now}, "attempts": {"$gte": JOB_MAX_ATTEMPTS}},
+            {
+                "$set": {"status": "failed", "stage": "failed", "error": "Ingestion worker stopped responding", "updated_at": now},
+                "$unset": {"active": ""}
+            }
+        )
+        if not abandoned:
+            break
+        await release_job_quota(abandoned, db)
+
+    return await db.ingestion_jobs.find_one_and_update(
+        {
+            "$or": [
+                {"status": "queued"},
+                {"status": "running", "lease_expires_at": {"$lt": now}}
+            ]
+        },
+        {
+            "$set": {
+                "status": "running",
+                "worker_id": worker_id,
+                "lease_expires_at": now + timedelta(seconds=JOB_LEASE_SECONDS),
+                "started_at": now,
+                "updated_at": now
+            },
+            "$inc": {"attempts": 1}
+        },
+        sort=[("created_at", 1)],
+        return_document=ReturnDocument.AFTER
+    )
+
+
+def owned_by(job_id: ObjectId, worker_id: str) -> Dict:
+    """Filter matching the job only while worker_id still holds its lease"""
+    return {"_id": job_id, "status": "running", "worker_id": worker_id}
+
+
+async def renew_job_lease(job_id: ObjectId, worker_id: str, db: Database) -> bool:
+    """
+    Extend the lease of a running job.
+
+    Returns:
+        False if the job was taken over by another worker or already finished
+    """
+    now = datetime.utcnow()
+    result = await db.ingestion_jobs.update_one(
+        owned_by(job_id, worker_id),
+        {"$set": {"lease_expires_at": now + timedelta(seconds=JOB_LEASE_SECONDS), "updated_at": now}}
+    )
+    return result.matched_count > 0
+
+
+async def update_job_stage(job_id: ObjectId, worker_id: str, stage: str, db: Database) -> None:
+    """Record a stage transition and renew the worker's lease"""
+    now = datetime.utcnow()
+    await db.ingestion_jobs.update_one(
+        owned_by(job_id, worker_id),
+        {
+            "$set": {
+                "stage": stage,
+                "lease_expires_at": now + timedelta(seconds=JOB_LEASE_SECONDS),
+                "updated_at": now
+            },
+            "$push": {"stages": {"name": stage, "started_at": now}}
+        }
+    )
+
+
+async def complete_job(job_id: ObjectId, worker_id: str, result: Dict, db: Database) -> bool:
+    """Returns False if worker_id lost the job to another worker"""
+    now = datetime.utcnow()
+    updated = await db.ingestion_jobs.update_one(
+        owned_by(job_id, worker_id),
+        {
+            "$set": {
+                "status": "completed",
+                "stage": "completed",
+                "result": result,
+                "lease_expires_at": None,
+                "finished_at": now,
+                "updated_at": now
+            },
+            "$unset": {"active": ""},
+            "$push": {"stages": {"name": "completed", "started_at": now}}
+        }
+    )
+    return updated.matched_count > 0
+
+
+async def fail_job(job_id: ObjectId, worker_id: str, message: str, db: Database) -> bool:
+    """Returns False if worker_id lost the job to another worker"""
+    now = datetime.utcnow()
+    job = await db.ingestion_jobs.find_one_and_update(
+        owned_by(job_id, worker_id),
+        {
+            "$set": {
+                "status": "failed",
+                "stage": "failed",
+                "error": message,
+                "lease_expires_at": None,
+                "finished_at": now,
+                "updated_at": now
+            },
+            "$unset": {"active": ""},
+            "$push": {"stages": {"name": "failed", "started_at": now}}
+        }
+    )
+    if not job:
+        return False
+    await release_job_quota(job, db)
+    return True
+
+
+async def release_job_quota(job: Dict, db: Database) -> None:
+    """Give back the org quota slot reserved when the job was enqueued"""
+    if job.get("org_id") and job.get("quota_month"):
+        await release_org_quota(job["org_id"], job["quota_month"], db)
+
+
+async def get_job(job_id: str, db: Database) -> Optional[Dict]:
+    try:
+        return await db.ingestion_jobs.find_one({"_id": ObjectId(job_id)})
+    except Exception:
+        return None
+
+
+def serialize_job(job: Dict) -> Dict:
+    """Job document -> API response"""
+    return {
+        "job_id": str(job["_id"]),
+        "repo_url": job["repo_url"],
+        "org_id": job.get("org_id"),
+        "status": job["status"],
+        "stage": job["stage"],
+        "stages": [
+            {"name": s["name"], "started_at": s["started_at"].isoformat()}
+            for s in job.get("stages", [])
+        ],
+        "attempts": job.get("attempts", 0),
+        "result": job.get("result"),
+        "error": job.get("error"),
+        "created_at": job["created_at"].isoformat(),
+        "updated_at": job["updated_at"].isoformat()
+    }
@@ -5,13 +5,21 @@ Handles org membership, invitations, quotas and repo access control.
 
 from fastapi import HTTPException, status
 from pymongo.database import Database
-from typing import Optional, Dict
+from pymongo.errors import DuplicateKeyError
+from typing import Optional, Dict, Set, Tuple
 from datetime import datetime
+import asyncio
+import time
 import os
-import httpx
+from core.http_clients import http_clients
 
 CLERK_API_KEY = os.getenv("CLERK_API_KEY")
-CLERK_API_URL = "https://api.clerk.com/v1"
+
+# membership decisions are cached per (org_id, user_id); denials expire sooner so new members get in quickly
+ORG_MEMBERSHIP_CACHE_TTL_SECONDS = int(os.getenv("ORG_MEMBERSHIP_CACHE_TTL_SECONDS", "300"))
+ORG_MEMBERSHIP_NEGATIVE_TTL_SECONDS = int(os.getenv("ORG_MEMBERSHIP_NEGATIVE_TTL_SECONDS", "30"))
+ORG_MEMBERSHIP_CACHE_MAX_ENTRIES = int(os.getenv("ORG_MEMBERSHIP_CACHE_MAX_ENTRIES", "10000"))
+ORG_ROLES = ["org:owner", "org:admin", "org:member"]
 
 
 async def require_org_access(repo_id: str, ctx: Dict, db: Database) -> Dict:
@@ -112,34 +120,34 @@ async def invite_member(org_id: str, email: str, ctx: Dict, db: Database) -> Dic
         if not CLERK_API_KEY:
             raise Exception("CLERK_API_KEY not configured")
         
-        async with httpx.AsyncClient() as client:
-            api_url = f"{CLERK_API_URL}/organizations/{org_id}/invitations"
-            
-            invitation_payload = {
-                "email_address": email,
-                "role": "org:member"  
-            }
+        client = http_clients.get("clerk")
+        api_url = f"/organizations/{org_id}/invitations"
+        
+        invitation_payload = {
+            "email_address": email,
+            "role": "org:member"  
+        }
+        
+        response = await client.post(
+            api_url,
+            json=invitation_payload,
+            headers={"Authorization": f"Bearer {CLERK_API_KEY}"}
+        )
+        
+        if response.status_code not in [200, 201]:
+            try:
+                error = response.json()
+                error_message = error.get('errors', [{}])[0].get('message', response.text)
+            except:
+                error_message = response.text
             
-            response = await client.post(
-                api_url,
-                json=invitation_payload,
-                headers={"Authorization": f"Bearer {CLERK_API_KEY}"}
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Failed to send invitation: {error_message}"
             )
-            
-            if response.status_code not in [200, 201]:
-                try:
-                    error = response.json()
-                    error_message = error.get('errors', [{}])[0].get('message', response.text)
-                except:
-                    error_message = response.text
-                
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f"Failed to send invitation: {error_message}"
-                )
-            
-            invitation_data = response.json()
-    
+        
+        invitation_data = response.json()
+
     except HTTPException:
         raise
     except Exception as e:
@@ -230,6 +238,65 @@ async def increment_org_quota(org_id: str, db: Database) -> None:
     )
 
 
+async def reserve_org_quota(org_id: str, org: Dict, db: Database) -> str:
+    """
+    Atomically take one ingestion slot from this month's quota.
+    A conditional upsert: it only increments while under quota, and when the month's
+    usage record is already full the upsert collides with the unique (org_id, month)
+    index instead of overrunning it. Two first reservations of a month can also collide
+    on the insert, so a collision is retried once as a plain conditional increment.
+    
+    Args:
+        org_id: Organization ID
+        org: Organization document (for ingestion_quota_monthly)
+        db: MongoDB connection
+    
+    Returns:
+        month key the slot was reserved in (pass it to release_org_quota)
+    
+    Raises:
+        HTTPException(402): Monthly quota exhausted
+    """
+    month_key = datetime.utcnow().strftime("%Y-%m")
+    team_quota = org.get("ingestion_quota_monthly", 100)
+    quota_error = HTTPException(
+        status_code=status.HTTP_402_PAYMENT_REQUIRED,
+        detail=f"Organization quota reached ({team_quota} repos/month). Upgrade to ingest more."
+    )
+    if team_quota <= 0:
+        raise quota_error
+    
+    under_quota = {"org_id": org_id, "month": month_key, "repos_ingested": {"$lt": team_quota}}
+    try:
+        await db.usage.find_one_and_update(
+            under_quota,
+            {"$inc": {"repos_ingested": 1}, "$setOnInsert": {"created_at": datetime.utcnow()}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # the record exists now (full, or created by a concurrent first reservation)
+        reserved = await db.usage.find_one_and_update(under_quota, {"$inc": {"repos_ingested": 1}})
+        if not reserved:
+            raise quota_error
+    
+    return month_key
+
+
+async def release_org_quota(org_id: str, month_key: str, db: Database) -> None:
+    """
+    Give back a slot taken by reserve_org_quota when the ingest did not happen.
+    
+    Args:
+        org_id: Organization ID
+        month_key: value returned by reserve_org_quota
+        db: MongoDB connection
+    """
+    await db.usage.update_one(
+        {"org_id": org_id, "month": month_key, "repos_ingested": {"$gt": 0}},
+        {"$inc": {"repos_ingested": -1}}
+    )
+
+
 async def reset_org_quota_if_needed(org_id: str, db: Database) -> None:
     """
     Reset monthly quota if month has changed.
@@ -290,22 +357,22 @@ async def get_org_details(org_id: str, db: Database) -> Dict:
     members = []
     if CLERK_API_KEY:
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"{CLERK_API_URL}/organizations/{org_id}/memberships",
-                    headers={"Authorization": f"Bearer {CLERK_API_KEY}"}
-                )
-                if response.status_code == 200:
-                    memberships = response.json()
-                    for membership in memberships.get("data", []):
-                        user_data = membership.get("public_user_data", {})
-                        members.append({
-                            "user_id": user_data.get("user_id"),
-                            "email": user_data.get("identifier"),
-                            "first_name": user_data.get("first_name"),
-                            "last_name": user_data.get("last_name"),
-                            "role": membership.get("role", "org:member").replace("org:", "")
-                        })
+            client = http_clients.get("clerk")
+            response = await client.get(
+                f"/organizations/{org_id}/memberships",
+                headers={"Authorization": f"Bearer {CLERK_API_KEY}"}
+            )
+            if response.status_code == 200:
+                memberships = response.json()
+                for membership in memberships.get("data", []):
+                    user_data = membership.get("public_user_data", {})
+                    members.append({
+                        "user_id": user_data.get("user_id"),
+                        "email": user_data.get("identifier"),
+                        "first_name": user_data.get("first_name"),
+                        "last_name": user_data.get("last_name"),
+                        "role": membership.get("role", "org:member").replace("org:", "")
+                    })
         except Exception as e:
             print(f"[OrgDetails] Warning: Could not fetch members from Clerk: {e}")
     
@@ -419,29 +486,29 @@ async def ensure_org_exists_in_db(org_id: str, db: Database, ctx: Dict = None) -
             print(f"[DEBUG] Created placeholder org {org_id} in MongoDB")
             return new_org
             
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{CLERK_API_URL}/organizations/{org_id}",
-                headers={"Authorization": f"Bearer {CLERK_API_KEY}"}
+        client = http_clients.get("clerk")
+        response = await client.get(
+            f"/organizations/{org_id}",
+            headers={"Authorization": f"Bearer {CLERK_API_KEY}"}
+        )
+        
+        if response.status_code != 200:
+            # Log the error but don't fail completely - org might exist in MongoDB
+            print(f"[WARN] Failed to fetch org {org_id} from Clerk API: {response.status_code}")
+            # Check MongoDB one more time before failing
+            org = await db.organizations.find_one({"org_id": org_id})
+            if org:
+                return org
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Organization {org_id} not found in Clerk. Please ensure the organization exists and you have access to it."
             )
-            
-            if response.status_code != 200:
-                # Log the error but don't fail completely - org might exist in MongoDB
-                print(f"[WARN] Failed to fetch org {org_id} from Clerk API: {response.status_code}")
-                # Check MongoDB one more time before failing
-                org = await db.organizations.find_one({"org_id": org_id})
-                if org:
-                    return org
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail=f"Organization {org_id} not found in Clerk. Please ensure the organization exists and you have access to it."
-                )
-            
-            clerk_org = response.json()
-            
-            # Sync to MongoDB
-            return await sync_org_from_clerk(org_id, clerk_org, db)
-    
+        
+        clerk_org = response.json()
+        
+        # Sync to MongoDB
+        return await sync_org_from_clerk(org_id, clerk_org, db)
+
     except HTTPException:
         raise
     except Exception as e:
@@ -452,3 +519,133 @@ async def ensure_org_exists_in_db(org_id: str, db: Database, ctx: Dict = None) -
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to verify organization: {str(e)}"
         )
+
+
+class OrgMembershipResolver:
+    """
+    Decides whether a user belongs to an organization.
+    Order: org owner -> JWT org role for that org -> MongoDB member list -> Clerk memberships API.
+    Members found via JWT or Clerk are synced into MongoDB. Decisions are cached in-process,
+    and concurrent Clerk lookups for the same org share one request.
+    """
+
+    def __init__(self):
+        # (org_id, user_id) -> (expires_at, org document or None if denied)
+        self.decisions: Dict[Tuple[str, str], Tuple[float, Optional[Dict]]] = {}
+        # org_id -> (expires_at, Clerk member user ids)
+        self.clerk_members: Dict[str, Tuple[float, Set[str]]] = {}
+        self.inflight: Dict[str, asyncio.Future] = {}
+
+    async def _fetch_clerk_member_ids(self, org_id: str) -> Set[str]:
+        response = await http_clients.get("clerk").get(
+            f"/organizations/{org_id}/memberships",
+            params={"limit": 500},
+            headers={"Authorization": f"Bearer {CLERK_API_KEY}"}
+        )
+        response.raise_for_status()
+        member_ids = {
+            membership.get("public_user_data", {}).get("user_id")
+            for membership in response.json().get("data", [])
+        }
+        self.clerk_members[org_id] = (time.monotonic() + ORG_MEMBERSHIP_CACHE_TTL_SECONDS, member_ids)
+        return member_ids
+
+    async def get_clerk_member_ids(self, org_id: str) -> Set[str]:
+        cached = self.clerk_members.get(org_id)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+
+        future = self.inflight.get(org_id)
+        if future is None:
+            future = asyncio.ensure_future(self._fetch_clerk_member_ids(org_id))
+            self.inflight[org_id] = future
+            future.add_done_callback(lambda _: self.inflight.pop(org_id, None))
+        # shield so one caller going away does not cancel the lookup for the others
+        return await asyncio.shield(future)
+
+    def _remember(self, key: Tuple[str, str], org: Optional[Dict]) -> None:
+        ttl = ORG_MEMBERSHIP_CACHE_TTL_SECONDS if org else ORG_MEMBERSHIP_NEGATIVE_TTL_SECONDS
+        self.decisions[key] = (time.monotonic() + ttl, org)
+        while len(self.decisions) > ORG_MEMBERSHIP_CACHE_MAX_ENTRIES:
+            del self.decisions[next(iter(self.decisions))]
+
+    def invalidate(self, org_id: str, user_id: Optional[str] = None) -> None:
+        """Forget cached decisions for one member, or for the whole org"""
+        if user_id:
+            self.decisions.pop((org_id, user_id), None)
+        else:
+            for key in [key for key in self.decisions if key[0] == org_id]:
+                del self.decisions[key]
+        self.clerk_members.pop(org_id, None)
+
+    async def resolve(self, org_id: str, ctx: Dict, db: Database, ensure_exists: bool = False) -> Optional[Dict]:
+        """
+        Args:
+            ensure_exists: sync the org from Clerk into MongoDB first if it is missing
+
+        Returns:
+            organization document if the user is a member, None otherwise
+        """
+        user_id = ctx.get("user_id")
+        key = (org_id, user_id)
+        has_org_access_from_jwt = ctx.get("org_id") == org_id and ctx.get("org_role") in ORG_ROLES
+
+        cached = self.decisions.get(key)
+        if cached and cached[0] > time.monotonic():
+            # a cached denial is re-checked when the token now carries a role for this org
+            if cached[1] is not None or not has_org_access_from_jwt:
+                return cached[1]
+
+        if ensure_exists:
+            org = await ensure_org_exists_in_db(org_id, db, ctx)
+        else:
+            org = await db.organizations.find_one({"org_id": org_id})
+        if not org:
+            self._remember(key, None)
+            return None
+
+        is_owner = org.get("owner_user_id") == user_id
+        is_member_in_db = user_id in org.get("member_user_ids", [])
+        has_access = is_owner or has_org_access_from_jwt or is_member_in_db
+
+        if not has_access and CLERK_API_KEY:
+            try:
+                has_access = user_id in await self.get_clerk_member_ids(org_id)
+            except Exception as e:
+                print(f"[OrgMembership] Warning: Could not verify Clerk membership: {e}")
+
+        if has_access and not is_member_in_db and not is_owner:
+            await db.organizations.update_one(
+                {"org_id": org_id},
+                {
+                    "$addToSet": {"member_user_ids": user_id},
+                    "$set": {"updated_at": datetime.utcnow()}
+                }
+            )
+            print(f"[OrgMembership] Synced {user_id} to org {org_id} member list")
+
+        self._remember(key, org if has_access else None)
+        return org if has_access else None
+
+
+async def require_org_membership(
+    org_id: str,
+    ctx: Dict,
+    db: Database,
+    detail: str = "You are not authorized to access this organization",
+    ensure_exists: bool = False
+) -> Dict:
+    """
+    Raise 403 unless the user is a member of org_id.
+
+    Returns:
+        organization document
+    """
+    org = await membership_resolver.resolve(org_id, ctx, db, ensure_exists=ensure_exists)
+    if not org:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=detail)
+    return org
+
+
+# global instance
+membership_resolver = OrgMembershipResolver()
@@ -6,13 +6,11 @@ from datetime import datetime, timedelta
 from typing import Optional, Dict, Tuple
 from models.schemas import PlanType, SubscriptionStatus, SubscriptionPlan, PaymentEvent
 from core.database import get_database
-import httpx
+from core.http_clients import http_clients
 from dotenv import load_dotenv
 
 load_dotenv()
 
-RAZORPAY_API_URL = "https://api.razorpay.com/v1"
-
 class PaymentService:
     def __init__(self):
         self.key_id = os.getenv("RAZORPAY_API_KEY")
@@ -51,60 +49,58 @@ class PaymentService:
             return user["plan"]["razorpay_customer_id"], None
         
         # Create new customer
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(
-                    f"{RAZORPAY_API_URL}/customers",
-                    auth=(self.key_id, self.key_secret),
-                    json={"email": email, "description": f"User: {user_id}"},
-                    timeout=10.0,
-                )
-                if response.status_code == 400:
-                    # Customer already exists
-                    try:
-                        error_json = response.json()
-                        if "Customer already exists" in error_json.get("error", {}).get("description", ""):
-                            # Try to fetch existing customer by email
-                            fetch_response = await client.get(
-                                f"{RAZORPAY_API_URL}/customers",
-                                auth=(self.key_id, self.key_secret),
-                                params={"email": email},
-                                timeout=10.0,
-                            )
-                            if fetch_response.status_code == 200:
-                                customers = fetch_response.json().get("items", [])
-                                if customers:
-                                    cust_id = customers[0]["id"]
-                                    # Store it in MongoDB for future use
-                                    await users.update_one(
-                                        {"user_id": user_id},
-                                        {"$set": {"plan.razorpay_customer_id": cust_id}},
-                                        upsert=True,
-                                    )
-                                    return cust_id, None
-                    except:
-                        pass
-                
-                if response.status_code != 200:
-                    error_msg = response.text
-                    try:
-                        error_json = response.json()
-                        error_msg = json.dumps(error_json, indent=2)
-                    except:
-                        pass
-                response.raise_for_status()
-                customer_data = response.json()
-                
-                # Store customer_id immediately for future retries
-                await users.update_one(
-                    {"user_id": user_id},
-                    {"$set": {"plan.razorpay_customer_id": customer_data["id"]}},
-                    upsert=True,
-                )
-                return customer_data["id"], None
-            except Exception as e:
-                print(f"[PaymentService] Failed to create customer: {str(e)}")
-                return None, str(e)
+        client = http_clients.get("razorpay")
+        try:
+            response = await client.post(
+                "/customers",
+                auth=(self.key_id, self.key_secret),
+                json={"email": email, "description": f"User: {user_id}"},
+            )
+            if response.status_code == 400:
+                # Customer already exists
+                try:
+                    error_json = response.json()
+                    if "Customer already exists" in error_json.get("error", {}).get("description", ""):
+                        # Try to fetch existing customer by email
+                        fetch_response = await client.get(
+                            "/customers",
+                            auth=(self.key_id, self.key_secret),
+                            params={"email": email},
+                                )
+                        if fetch_response.status_code == 200:
+                            customers = fetch_response.json().get("items", [])
+                            if customers:
+                                cust_id = customers[0]["id"]
+                                # Store it in MongoDB for future use
+                                await users.update_one(
+                                    {"user_id": user_id},
+                                    {"$set": {"plan.razorpay_customer_id": cust_id}},
+                                    upsert=True,
+                                )
+                                return cust_id, None
+                except:
+                    pass
+            
+            if response.status_code != 200:
+                error_msg = response.text
+                try:
+                    error_json = response.json()
+                    error_msg = json.dumps(error_json, indent=2)
+                except:
+                    pass
+            response.raise_for_status()
+            customer_data = response.json()
+            
+            # Store customer_id immediately for future retries
+            await users.update_one(
+                {"user_id": user_id},
+                {"$set": {"plan.razorpay_customer_id": customer_data["id"]}},
+                upsert=True,
+            )
+            return customer_data["id"], None
+        except Exception as e:
+            print(f"[PaymentService] Failed to create customer: {str(e)}")
+            return None, str(e)
 
     async def create_subscription(
         self, user_id: str, email: str, plan: PlanType
@@ -124,57 +120,56 @@ class PaymentService:
         # Create subscription
         plan_config = self.plan_config[plan]
         
-        async with httpx.AsyncClient() as client:
-            try:
-                payload = {
-                    "plan_id": plan_config["razorpay_id"],
-                    "customer_id": customer_id,
-                    "customer_notify": 1,
-                    "quantity": 1,
-                    "total_count": 10,  
-                }
-                response = await client.post(
-                    f"{RAZORPAY_API_URL}/subscriptions",
-                    auth=(self.key_id, self.key_secret),
-                    json=payload,
-                    timeout=10.0,
-                )
-                if response.status_code not in [200, 201]:
-                    error_msg = response.text
-                    try:
-                        error_json = response.json()
-                        error_msg = json.dumps(error_json, indent=2)
-                    except:
-                        pass
-                response.raise_for_status()
-                sub_data = response.json()
-                
-                # store customer_id in user doc for future ref
-                db = get_database()
-                users = db["users"]
-                await users.update_one(
-                    {"user_id": user_id},
-                    {
-                        "$set": {
-                            "plan.razorpay_customer_id": customer_id,
-                            "plan.updated_at": datetime.utcnow(),
-                        }
-                    },
-                    upsert=True,
-                )
-                
-                return {
-                    "razorpay_subscription_id": sub_data["id"],
-                    "status": sub_data["status"],
-                    "customer_id": customer_id,
-                    "amount": plan_config["price_inr"] * 100,  # convert to paise
-                    "currency": "INR",
-                    "customer_email": email,
-                    "razorpay_key_id": self.key_id,
-                }, None
-            except Exception as e:
-                print(f"[PaymentService] Failed to create subscription: {str(e)}")
-                return None, str(e)
+        client = http_clients.get("razorpay")
+        try:
+            payload = {
+                "plan_id": plan_config["razorpay_id"],
+                "customer_id": customer_id,
+                "customer_notify": 1,
+                "quantity": 1,
+                "total_count": 10,  
+            }
+            response = await client.post(
+                "/subscriptions",
+                auth=(self.key_id, self.key_secret),
+                json=payload,
+            )
+            if response.status_code not in [200, 201]:
+                error_msg = response.text
+                try:
+                    error_json = response.json()
+                    error_msg = json.dumps(error_json, indent=2)
+                except:
+                    pass
+            response.raise_for_status()
+            sub_data = response.json()
+            
+            # store customer_id in user doc for future ref
+            db = get_database()
+            users = db["users"]
+            await users.update_one(
+                {"user_id": user_id},
+                {
+                    "$set": {
+                        "plan.razorpay_customer_id": customer_id,
+                        "plan.updated_at": datetime.utcnow(),
+                    }
+                },
+                upsert=True,
+            )
+            
+            return {
+                "razorpay_subscription_id": sub_data["id"],
+                "status": sub_data["status"],
+                "customer_id": customer_id,
+                "amount": plan_config["price_inr"] * 100,  # convert to paise
+                "currency": "INR",
+                "customer_email": email,
+                "razorpay_key_id": self.key_id,
+            }, None
+        except Exception as e:
+            print(f"[PaymentService] Failed to create subscription: {str(e)}")
+            return None, str(e)
 
     def verify_webhook_signature(self, body: str, signature: str) -> bool:
         """Verify Razorpay webhook signature for security."""
@@ -0,0 +1,197 @@
+"""
+Repository fetch layer.
+
+Modes (REPO_FETCH_MODE):
+    mirror  - keep a bare partial clone per repo URL in REPO_CACHE_PATH that tracks only
+              branches (no tags, pull request or other refs), refresh it with `git fetch`
+              and check out a worktree from it; repeat ingests only transfer new objects
+              (default)
+    shallow - depth-1 clone; re-ingests fall back to comparing file hashes
+    full    - full-history clone
+
+REPO_CLONE_FILTER (default "blob:none") makes clones/mirrors partial: commits and trees
+are fetched up front (enough for `git diff --name-status`), file contents only for the
+checked-out commit. Mirrors are evicted least-recently-used once the cache exceeds
+REPO_CACHE_MAX_BYTES.
+"""
+
+import os
+import re
+import shutil
+import hashlib
+import subprocess
+import git
+from contextlib import contextmanager
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows dev machines: no cross-process locking
+    fcntl = None
+
+REPO_FETCH_MODE = os.getenv("REPO_FETCH_MODE", "mirror")
+REPO_CLONE_FILTER = os.getenv("REPO_CLONE_FILTER", "blob:none")
+REPO_CACHE_PATH = os.getenv("REPO_CACHE_PATH", os.path.join(os.path.dirname(__file__), "..", "repo_cache"))
+REPO_CACHE_MAX_BYTES = int(os.getenv("REPO_CACHE_MAX_BYTES", str(5 * 1024 ** 3)))
+# branches only: `clone --mirror` would also pull refs/pull/* and every tag
+MIRROR_REFSPEC = "+refs/heads/*:refs/heads/*"
+
+
+def strip_credentials(repo_url: str) -> str:
+    """https://<token>@github.com/... -> https://github.com/..."""
+    return re.sub(r"://[^/@]+@", "://", repo_url)
+
+
+def get_mirror_key(repo_url: str) -> str:
+    normalized = strip_credentials(repo_url).rstrip("/")
+    if normalized.endswith(".git"):
+        normalized = normalized[:-4]
+    return hashlib.sha256(normalized.lower().encode()).hexdigest()[:32]
+
+
+@contextmanager
+def mirror_lock(key: str, blocking: bool = True):
+    """
+    Exclusive lock on one mirror across worker processes on this host.
+    Yields False if blocking=False and another process holds it.
+    """
+    os.makedirs(REPO_CACHE_PATH, exist_ok=True)
+    if fcntl is None:
+        yield True
+        return
+
+    with open(os.path.join(REPO_CACHE_PATH, f"{key}.lock"), "w") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def get_dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for file in files:
+            try:
+                total += os.lstat(os.path.join(root, file)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def clone_options(depth: Optional[int] = None) -> list[str]:
+    options = []
+    if depth:
+        options.append(f"--depth={depth}")
+    if REPO_CLONE_FILTER:
+        options.append(f"--filter={REPO_CLONE_FILTER}")
+    return options
+
+
+def track_branches_only(mirror: git.Repo) -> None:
+    """Point the mirror's fetch refspec at branches; mirrors cloned with --mirror drop their other refs"""
+    with mirror.config_reader() as config:
+        was_mirror = config.get_value('remote "origin"', "mirror", default=False)
+    mirror.git.config("remote.origin.fetch", MIRROR_REFSPEC)
+    mirror.git.config("remote.origin.tagOpt", "--no-tags")
+    if not was_mirror:
+        return
+
+    mirror.git.config("--unset", "remote.origin.mirror")
+    stale_refs = [ref for ref in mirror.git.for_each_ref("--format=%(refname)").splitlines() if not ref.startswith("refs/heads/")]
+    if stale_refs:
+        subprocess.run(
+            ["git", "update-ref", "--stdin"], cwd=mirror.git_dir, check=True,
+            input="".join(f"delete {ref}\n" for ref in stale_refs).encode()
+        )
+
+
+def fetch_mirror(repo_url: str, authenticated_url: str, key: str) -> git.Repo:
+    """Create or refresh the bare mirror for repo_url. Caller holds the mirror lock."""
+    mirror_path = os.path.join(REPO_CACHE_PATH, f"{key}.git")
+
+    if os.path.isdir(mirror_path):
+        mirror = git.Repo(mirror_path)
+        track_branches_only(mirror)
+        # the token is passed per command so it never lands in the mirror's config
+        mirror.git(c=f"remote.origin.url={authenticated_url}").fetch("origin", "--prune")
+        mirror.git.worktree("prune")
+        print(f"Refreshed cached mirror {key}")
+    else:
+        mirror = git.Repo.clone_from(authenticated_url, mirror_path, multi_options=["--bare", "--no-tags"] + clone_options())
+        mirror.git.remote("set-url", "origin", strip_credentials(repo_url))
+        # a bare clone has no fetch refspec, so later fetches would not update its branches
+        track_branches_only(mirror)
+        print(f"Created cached mirror {key}")
+    return mirror
+
+
+def record_mirror_size(key: str) -> None:
+    """LRU bookkeeping: last use time + size, including blobs fetched for the checkout"""
+    with open(os.path.join(REPO_CACHE_PATH, f"{key}.size"), "w") as f:
+        f.write(str(get_dir_size(os.path.join(REPO_CACHE_PATH, f"{key}.git"))))
+
+
+def evict_mirrors(keep_key: str) -> None:
+    """Delete least recently used mirrors until the cache fits REPO_CACHE_MAX_BYTES"""
+    mirrors = []
+    for entry in os.listdir(REPO_CACHE_PATH):
+        if not entry.endswith(".size"):
+            continue
+        key = entry[:-len(".size")]
+        size_path = os.path.join(REPO_CACHE_PATH, entry)
+        try:
+            with open(size_path) as f:
+                size = int(f.read().strip() or 0)
+            mirrors.append((os.path.getmtime(size_path), key, size))
+        except (OSError, ValueError):
+            continue
+
+    total = sum(size for _, _, size in mirrors)
+    for _, key, size in sorted(mirrors):
+        if total <= REPO_CACHE_MAX_BYTES:
+            break
+        if key == keep_key:
+            continue
+        with mirror_lock(key, blocking=False) as acquired:
+            # skip mirrors another worker is fetching or checking out right now
+            if not acquired:
+                continue
+            shutil.rmtree(os.path.join(REPO_CACHE_PATH, f"{key}.git"), ignore_errors=True)
+            os.remove(os.path.join(REPO_CACHE_PATH, f"{key}.size"))
+        total -= size
+        print(f"Evicted cached mirror {key} ({size} bytes)")
+
+
+def fetch_repository(repo_url: str, authenticated_url: str, repo_path: str) -> git.Repo:
+    """
+    Materialize the repository's default branch at repo_path.
+
+    Returns:
+        git.Repo for the checkout; history is available for diffs in full and mirror modes
+    """
+    if REPO_FETCH_MODE == "shallow":
+        return git.Repo.clone_from(authenticated_url, repo_path, multi_options=clone_options(depth=1))
+
+    if REPO_FETCH_MODE != "mirror":
+        return git.Repo.clone_from(authenticated_url, repo_path, multi_options=clone_options())
+
+    key = get_mirror_key(repo_url)
+    with mirror_lock(key):
+        mirror = fetch_mirror(repo_url, authenticated_url, key)
+        head_sha = mirror.git.rev_parse("HEAD")
+        # a worktree shares the mirror's objects; missing blobs of a partial mirror are
+        # fetched from origin during checkout, so that needs the token as well
+        mirror.git(c=f"remote.origin.url={authenticated_url}").worktree("add", "--detach", os.path.abspath(repo_path), head_sha)
+        record_mirror_size(key)
+
+    try:
+        evict_mirrors(keep_key=key)
+    except Exception as e:
+        print(f"Warning: Failed to evict cached mirrors: {e}")
+
+    return git.Repo(repo_path)
@@ -0,0 +1,111 @@
+"""
+Ingestion worker.
+Pulls jobs off the Mongo-backed ingestion queue and runs them, one at a time.
+Scale ingestion throughput by running more worker processes:
+
+    python worker.py
+"""
+
+import asyncio
+import os
+import socket
+import time
+import traceback
+from dotenv import load_dotenv
+from core.database import connect_to_mongo, close_mongo_connection, get_database
+from core.http_clients import http_clients
+from qdrant_client import QdrantClient
+from services.ingestion import ingest_repo, shutdown_split_pool, QDRANT_URL, QDRANT_API_KEY
+from services.collection_manager import collect_retired_collections
+from services.ingestion_jobs import (
+    claim_next_job, renew_job_lease, update_job_stage, complete_job, fail_job, JOB_HEARTBEAT_SECONDS
+)
+
+load_dotenv()
+
+POLL_INTERVAL_SECONDS = float(os.getenv("INGEST_WORKER_POLL_INTERVAL", "2"))
+COLLECTION_GC_INTERVAL_SECONDS = float(os.getenv("COLLECTION_GC_INTERVAL", "60"))
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+async def keep_lease(job_id, ingest: asyncio.Task) -> None:
+    """Renew the job's lease while it runs; stop the ingest if another worker took the job over"""
+    db = get_database()
+    while True:
+        await asyncio.sleep(JOB_HEARTBEAT_SECONDS)
+        try:
+            renewed = await renew_job_lease(job_id, WORKER_ID, db)
+        except Exception as e:
+            # a missed renewal is retried on the next beat, the lease is much longer
+            print(f"[Worker {WORKER_ID}] Lease renewal for job {job_id} failed: {e}")
+            continue
+        if not renewed:
+            print(f"[Worker {WORKER_ID}] Lost the lease on job {job_id}, stopping it")
+            ingest.cancel()
+            return
+
+
+async def run_job(job: dict) -> None:
+    db = get_database()
+    job_id = job["_id"]
+    print(f"[Worker {WORKER_ID}] Running job {job_id} for {job['repo_url']} (attempt {job['attempts']})")
+
+    async def on_stage(stage: str):
+        await update_job_stage(job_id, WORKER_ID, stage, db)
+
+    ingest = asyncio.create_task(
+        ingest_repo(job["repo_url"], job["user_id"], org_id=job.get("org_id"), on_stage=on_stage)
+    )
+    heartbeat = asyncio.create_task(keep_lease(job_id, ingest))
+    try:
+        result = await ingest
+    except asyncio.CancelledError:
+        if heartbeat.done():
+            # cancelled by keep_lease: the job belongs to another worker now
+            return
+        raise
+    except Exception as e:
+        traceback.print_exc()
+        await fail_job(job_id, WORKER_ID, str(e), db)
+        return
+    finally:
+        heartbeat.cancel()
+
+    if result["status"] == "error":
+        print(f"[Worker {WORKER_ID}] Job {job_id} failed: {result['message']}")
+        await fail_job(job_id, WORKER_ID, result["message"], db)
+        return
+
+    if await complete_job(job_id, WORKER_ID, result, db):
+        print(f"[Worker {WORKER_ID}] Job {job_id} completed")
+    else:
+        print(f"[Worker {WORKER_ID}] Job {job_id} finished after another worker took it over, result discarded")
+
+
+async def main():
+    await connect_to_mongo()
+    qdrant_client = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY)
+    last_gc = 0.0
+    print(f"[Worker {WORKER_ID}] Waiting for ingestion jobs...")
+    try:
+        while True:
+            job = await claim_next_job(WORKER_ID, get_database())
+            if not job:
+                # idle: drop collection versions replaced by blue/green re-indexes
+                if time.monotonic() - last_gc >= COLLECTION_GC_INTERVAL_SECONDS:
+                    last_gc = time.monotonic()
+                    try:
+                        await collect_retired_collections(qdrant_client, get_database())
+                    except Exception as e:
+                        print(f"[Worker {WORKER_ID}] Collection GC failed: {e}")
+                await asyncio.sleep(POLL_INTERVAL_SECONDS)
+                continue
+            await run_job(job)
+    finally:
+        shutdown_split_pool()
+        await http_clients.close()
+        await close_mongo_connection()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -62,12 +62,12 @@ const AddRepoPage = () => {
     setLoading(true);
 
     try {
-      const token = await getToken();
-      await repoService.ingestRepo(repoUrl, token, activeOrgId);
+      await repoService.ingestRepo(repoUrl, getToken, activeOrgId);
       
       const repoName = repoUrl.split('/').pop()?.replace('.git', '') || 'repository';
       
       // Refresh repositories list  
+      const token = await getToken();
       const result = await repoService.getRepositories(token, workspaceType, activeOrgId);
       setRepositories(result.repositories || []);
       
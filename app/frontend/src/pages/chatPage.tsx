@@ -100,11 +100,16 @@ const ChatPage = () => {
         using_org: activeOrgId && activeOrgId !== 'personal' ? 'YES' : 'NO'
       });
       
-      const data = await chatService.sendMessage(currentInput, token, repoName || undefined);
+      // add AI resp to UI and fill it in as tokens stream
+      setMessages(prev => [...prev, { role: "ai", text: "" }]);
+      const appendToAnswer = (chunk: string) => {
+        setMessages(prev => {
+          const last = prev[prev.length - 1];
+          return [...prev.slice(0, -1), { ...last, text: last.text + chunk }];
+        });
+      };
 
-      // add AI resp to UI
-      const AImsg = { role: "ai", text: data.response}
-      setMessages(prev => [...prev, AImsg]);
+      await chatService.streamMessage(currentInput, token, repoName || undefined, appendToAnswer);
     } catch (error) {
       console.error("Error connecting to backend:", error);
       const errorMsg = error instanceof Error ? error.message : "Unknown error";
@@ -18,6 +18,8 @@ const ClonedReposPage = () => {
   const navigate = useNavigate();
   const { getToken } = useAuth();
   const [repos, setRepos] = useState<Repository[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [loading, setLoading] = useState(true);
   const [deletingId, setDeletingId] = useState<string | null>(null);
   const [activeOrgId, setActiveOrgId] = useState<string | null>(null);
@@ -43,6 +45,7 @@ const ClonedReposPage = () => {
       const token = await getToken();
       const data = await repoService.getRepositories(token, workspaceType, activeOrgId);
       setRepos(data.repositories || []);
+      setNextCursor(data.next_cursor || null);
     } catch (error) {
       console.error("Failed to load repositories:", error);
     } finally {
@@ -50,6 +53,21 @@ const ClonedReposPage = () => {
     }
   };
 
+  const loadMoreRepositories = async () => {
+    if (!nextCursor) return;
+    try {
+      setLoadingMore(true);
+      const token = await getToken();
+      const data = await repoService.getRepositories(token, workspaceType, activeOrgId, nextCursor);
+      setRepos(prev => [...prev, ...(data.repositories || [])]);
+      setNextCursor(data.next_cursor || null);
+    } catch (error) {
+      console.error("Failed to load more repositories:", error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const handleNavigateToChat = (repo: Repository) => {
     navigate('/chat', { 
       state: { 
@@ -166,6 +184,17 @@ const ClonedReposPage = () => {
           </div>
         ))}
         </div>
+        {nextCursor && (
+          <div className="flex justify-center mt-6">
+            <button
+              onClick={loadMoreRepositories}
+              disabled={loadingMore}
+              className="bg-gray-700 hover:bg-gray-600 disabled:cursor-not-allowed px-6 py-2 rounded-lg text-sm font-medium"
+            >
+              {loadingMore ? "Loading..." : "Load more"}
+            </button>
+          </div>
+        )}
       </div>
     </div>
   );
@@ -1,4 +1,7 @@
 const BASE_URL = import.meta.env.VITE_API_URL;
+const INGEST_POLL_INTERVAL_MS = 2000;
+// give up polling after this long; the job keeps running on the worker
+const INGEST_POLL_TIMEOUT_MS = 30 * 60 * 1000;
 
 async function getAuthHeaders(token: string | null): Promise<HeadersInit> {
   const headers: HeadersInit = {
@@ -49,6 +52,65 @@ export const chatService = {
     return handleResponse(response);
   },
 
+  // Streams the answer over SSE; onToken receives each chunk as it arrives
+  async streamMessage(
+    message: string,
+    token: string | null,
+    repositoryName: string | undefined,
+    onToken: (text: string) => void
+  ): Promise<{ response: string; sources: { filename: string; path: string }[] }> {
+    const response = await fetch(`${BASE_URL}/api/chat/stream`, {
+      method: "POST",
+      headers: await getAuthHeaders(token),
+      body: JSON.stringify({ message, repository_name: repositoryName }),
+    });
+
+    if (!response.ok || !response.body) {
+      await handleResponse(response);
+      throw new Error(`Request failed with status ${response.status}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    let answer = "";
+    let sources: { filename: string; path: string }[] = [];
+
+    while (true) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      // SSE events are separated by a blank line
+      let boundary;
+      while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+        const rawEvent = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+
+        let eventName = "message";
+        let data = "";
+        for (const line of rawEvent.split("\n")) {
+          if (line.startsWith("event: ")) eventName = line.slice(7);
+          else if (line.startsWith("data: ")) data += line.slice(6);
+        }
+        const payload = data ? JSON.parse(data) : {};
+
+        if (eventName === "sources") {
+          sources = payload.sources;
+        } else if (eventName === "token") {
+          answer += payload.content;
+          onToken(payload.content);
+        } else if (eventName === "done") {
+          answer = payload.response;
+        } else if (eventName === "error") {
+          throw new Error(payload.message);
+        }
+      }
+    }
+
+    return { response: answer, sources };
+  },
+
   async getChatHistory(repositoryName: string, token: string | null) {
     const url = `${BASE_URL}/api/chat/history/${encodeURIComponent(repositoryName)}`;
     
@@ -62,7 +124,8 @@ export const chatService = {
 };
 
 export const repoService = {
-  async ingestRepo(repoUrl: string, token: string | null, orgId?: string | null) {
+  // getToken is called for every request, so polling outlives short-lived session tokens
+  async ingestRepo(repoUrl: string, getToken: () => Promise<string | null>, orgId?: string | null) {
     const body: any = { 
       repo_url: repoUrl
     };
@@ -73,14 +136,38 @@ export const repoService = {
     
     const response = await fetch(`${BASE_URL}/api/ingest`, {
       method: "POST",
-      headers: await getAuthHeaders(token),
+      headers: await getAuthHeaders(await getToken()),
       body: JSON.stringify(body),
     });
     
+    const { job_id } = await handleResponse(response);
+    
+    // ingestion runs in a background worker; poll until the job finishes
+    const deadline = Date.now() + INGEST_POLL_TIMEOUT_MS;
+    while (Date.now() < deadline) {
+      await new Promise((resolve) => setTimeout(resolve, INGEST_POLL_INTERVAL_MS));
+      const job = await this.getIngestJob(job_id, await getToken());
+      
+      if (job.status === "completed") {
+        return job.result;
+      }
+      if (job.status === "failed") {
+        throw new Error(`400: ${job.error || "Ingestion failed"}`);
+      }
+    }
+    throw new Error("Ingestion is taking longer than expected. It is still running, check your repositories again later.");
+  },
+
+  async getIngestJob(jobId: string, token: string | null) {
+    const response = await fetch(`${BASE_URL}/api/ingest/jobs/${jobId}`, {
+      method: "GET",
+      headers: await getAuthHeaders(token),
+    });
+    
     return handleResponse(response);
   },
 
-  async getRepositories(token: string | null, workspaceType: "personal" | "org" = "personal", orgId?: string | null) {
+  async getRepositories(token: string | null, workspaceType: "personal" | "org" = "personal", orgId?: string | null, cursor?: string | null) {
     const params = new URLSearchParams();
     params.append("workspace_type", workspaceType);
     
@@ -88,6 +175,10 @@ export const repoService = {
       params.append("org_id", orgId);
     }
     
+    if (cursor) {
+      params.append("cursor", cursor);
+    }
+    
     const queryString = params.toString();
     const url = `${BASE_URL}/api/repositories${queryString ? "?" + queryString : ""}`;
     
@@ -102,13 +102,31 @@ services:
       options:
         max-size: "10m"
         max-file: "3"
+
+  worker:
+    image: ${ecr_repository}:latest
+    container_name: infralens-worker
+    command: python worker.py
+    environment:
+      - MONGODB_URL=$MONGODB_URL
+      - QDRANT_URL=$QDRANT_URL
+      - QDRANT_API_KEY=$QDRANT_API_KEY
+      - GROQ_API_KEY=$GROQ_API_KEY
+      - CLERK_SECRET_KEY=$CLERK_SECRET_KEY
+      - CLERK_JWKS_URL=$CLERK_JWKS_URL
+    restart: unless-stopped
+    logging:
+      driver: "json-file"
+      options:
+        max-size: "10m"
+        max-file: "3"
 EOF
 
 # Pull and start the container
 echo "Pulling Docker image..."
 docker compose pull
 
-echo "Starting InfraLens backend..."
+echo "Starting InfraLens backend and ingestion worker..."
 docker compose up -d
 
 # Create systemd service for auto-restart